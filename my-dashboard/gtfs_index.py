@@ -0,0 +1,287 @@
+import argparse
+import csv
+import io
+import os
+import sqlite3
+import threading
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from utils import CACHE_DIR
+
+# Offline timetable built from a GTFS static feed (e.g. VBB), used by the
+# transit tile when the BVG API cannot be reached.
+GTFS_INDEX_PATH = CACHE_DIR / "gtfs.sqlite3"
+IMPORT_BATCH_SIZE = 5000
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+_GTFS_DB = None
+_GTFS_DB_MTIME = None
+_GTFS_DB_LOCK = threading.Lock()
+
+
+def stop_key(stop_id):
+    # Same reduction transit.py applies to BVG ids: de:11000:900110005:2:53 -> 900110005.
+    return stop_id.split(":")[2] if stop_id.count(":") >= 2 else stop_id
+
+
+def _open_feed(source):
+    source = Path(source)
+    if source.is_dir():
+        def open_member(name):
+            return open(source / name, encoding="utf-8-sig", newline="")
+    else:
+        archive = zipfile.ZipFile(source)
+
+        def open_member(name):
+            return io.TextIOWrapper(archive.open(name), encoding="utf-8-sig", newline="")
+    return open_member
+
+
+def _rows(open_member, name):
+    try:
+        handle = open_member(name)
+    except (FileNotFoundError, KeyError):
+        return
+    with handle:
+        yield from csv.DictReader(handle)
+
+
+def _batched(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _seconds(value):
+    hours, minutes, seconds = (int(part) for part in value.strip().split(":"))
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def import_gtfs(source, db_path=GTFS_INDEX_PATH, stop_names=None):
+    open_member = _open_feed(source)
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = db_path.with_suffix(".importing")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    conn = sqlite3.connect(str(tmp_path))
+    conn.executescript(
+        """
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE stops (stop_key TEXT, name TEXT);
+        CREATE TABLE calendar (
+            service_id TEXT, start_date INTEGER, end_date INTEGER,
+            monday INTEGER, tuesday INTEGER, wednesday INTEGER, thursday INTEGER,
+            friday INTEGER, saturday INTEGER, sunday INTEGER
+        );
+        CREATE TABLE calendar_dates (service_id TEXT, date INTEGER, exception_type INTEGER);
+        CREATE TABLE departures (
+            stop_key TEXT, service_id TEXT, dep_seconds INTEGER,
+            line TEXT, headsign TEXT, next_stop TEXT
+        );
+        CREATE TEMP TABLE feed_stops (stop_id TEXT PRIMARY KEY, stop_key TEXT, name TEXT);
+        CREATE TEMP TABLE feed_trips (trip_id TEXT PRIMARY KEY, service_id TEXT, line TEXT, headsign TEXT);
+        CREATE TEMP TABLE stop_times (trip_id TEXT, seq INTEGER, stop_id TEXT, dep_seconds INTEGER);
+        """
+    )
+    timezone = next((row.get("agency_timezone") for row in _rows(open_member, "agency.txt")), None)
+    conn.execute("INSERT INTO meta VALUES ('timezone', ?)", (timezone or "",))
+
+    wanted = [name.lower() for name in stop_names or []]
+    for batch in _batched(_rows(open_member, "stops.txt")):
+        conn.executemany(
+            "INSERT OR REPLACE INTO feed_stops VALUES (?, ?, ?)",
+            [(row["stop_id"], stop_key(row["stop_id"]), row.get("stop_name", "")) for row in batch],
+        )
+    if wanted:
+        keys = {
+            key
+            for key, name in conn.execute("SELECT stop_key, name FROM feed_stops")
+            if any(query in name.lower() for query in wanted)
+        }
+    else:
+        keys = None
+    conn.execute("INSERT INTO stops SELECT DISTINCT stop_key, name FROM feed_stops")
+
+    routes = {
+        row["route_id"]: row.get("route_short_name") or row.get("route_long_name") or ""
+        for row in _rows(open_member, "routes.txt")
+    }
+    for batch in _batched(_rows(open_member, "trips.txt")):
+        conn.executemany(
+            "INSERT OR REPLACE INTO feed_trips VALUES (?, ?, ?, ?)",
+            [
+                (row["trip_id"], row["service_id"], routes.get(row["route_id"], ""), row.get("trip_headsign", ""))
+                for row in batch
+            ],
+        )
+    for batch in _batched(_rows(open_member, "calendar.txt")):
+        conn.executemany(
+            "INSERT INTO calendar VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (row["service_id"], int(row["start_date"]), int(row["end_date"]))
+                + tuple(int(row.get(day) or 0) for day in WEEKDAYS)
+                for row in batch
+            ],
+        )
+    for batch in _batched(_rows(open_member, "calendar_dates.txt")):
+        conn.executemany(
+            "INSERT INTO calendar_dates VALUES (?, ?, ?)",
+            [(row["service_id"], int(row["date"]), int(row["exception_type"])) for row in batch],
+        )
+    for batch in _batched(_rows(open_member, "stop_times.txt")):
+        conn.executemany(
+            "INSERT INTO stop_times VALUES (?, ?, ?, ?)",
+            [
+                (row["trip_id"], int(row["stop_sequence"]), row["stop_id"], _seconds(row["departure_time"]))
+                for row in batch
+                if row.get("departure_time")
+            ],
+        )
+
+    # Keep only real departures (a following stop exists), labelled with that next stop.
+    conn.execute(
+        """
+        INSERT INTO departures
+        SELECT s.stop_key, t.service_id, st.dep_seconds, t.line, t.headsign, n.name
+        FROM (
+            SELECT trip_id, stop_id, dep_seconds,
+                   LEAD(stop_id) OVER (PARTITION BY trip_id ORDER BY seq) AS next_stop_id
+            FROM stop_times
+        ) AS st
+        JOIN feed_trips AS t ON t.trip_id = st.trip_id
+        JOIN feed_stops AS s ON s.stop_id = st.stop_id
+        JOIN feed_stops AS n ON n.stop_id = st.next_stop_id
+        """
+    )
+    if keys is not None:
+        conn.execute("CREATE TEMP TABLE wanted_keys (stop_key TEXT PRIMARY KEY)")
+        conn.executemany("INSERT INTO wanted_keys VALUES (?)", [(key,) for key in keys])
+        conn.execute("DELETE FROM departures WHERE stop_key NOT IN (SELECT stop_key FROM wanted_keys)")
+        conn.execute("DELETE FROM stops WHERE stop_key NOT IN (SELECT stop_key FROM wanted_keys)")
+    conn.executescript(
+        """
+        DROP TABLE stop_times;
+        CREATE INDEX departures_by_stop_service ON departures (stop_key, service_id, dep_seconds);
+        CREATE INDEX stops_by_name ON stops (name);
+        CREATE INDEX calendar_dates_by_date ON calendar_dates (date);
+        """
+    )
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM departures").fetchone()[0]
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(tmp_path, db_path)
+    return count
+
+
+def _gtfs_db():
+    global _GTFS_DB, _GTFS_DB_MTIME
+    try:
+        mtime = GTFS_INDEX_PATH.stat().st_mtime
+    except OSError:
+        return None
+    if _GTFS_DB is None or mtime != _GTFS_DB_MTIME:
+        # Reopen after a re-import replaced the file.
+        _GTFS_DB = sqlite3.connect(f"file:{GTFS_INDEX_PATH}?mode=ro", uri=True, check_same_thread=False)
+        _GTFS_DB_MTIME = mtime
+    return _GTFS_DB
+
+
+def _feed_timezone(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = 'timezone'").fetchone()
+    if not row or not row[0]:
+        return None
+    try:
+        from zoneinfo import ZoneInfo
+    except Exception:
+        return None
+    try:
+        return ZoneInfo(row[0])
+    except Exception:
+        return None
+
+
+def _active_services(conn, day):
+    date = int(day.strftime("%Y%m%d"))
+    weekday = WEEKDAYS[day.weekday()]
+    rows = conn.execute(
+        f"SELECT service_id FROM calendar WHERE start_date <= ? AND end_date >= ? AND {weekday} = 1 "
+        "UNION SELECT service_id FROM calendar_dates WHERE date = ? AND exception_type = 1 "
+        "EXCEPT SELECT service_id FROM calendar_dates WHERE date = ? AND exception_type = 2",
+        (date, date, date, date),
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def find_stop(query):
+    with _GTFS_DB_LOCK:
+        conn = _gtfs_db()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute(
+                "SELECT stop_key, name FROM stops WHERE name LIKE ? ORDER BY length(name) LIMIT 1",
+                (f"%{query}%",),
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+    return tuple(row) if row else None
+
+
+def scheduled_departures(key, limit, line_filter=None, now=None):
+    with _GTFS_DB_LOCK:
+        conn = _gtfs_db()
+        if conn is None:
+            return None
+        try:
+            tzinfo = _feed_timezone(conn)
+            if now is None:
+                now = datetime.now(tzinfo) if tzinfo else datetime.now().astimezone()
+            departures = []
+            # Trips after midnight belong to the previous service day (times past 24:00).
+            for offset in (1, 0):
+                day = now.date() - timedelta(days=offset)
+                services = _active_services(conn, day)
+                if not services:
+                    continue
+                midnight = datetime(day.year, day.month, day.day, tzinfo=now.tzinfo)
+                since = int((now - midnight).total_seconds())
+                placeholders = ",".join("?" * len(services))
+                sql = (
+                    "SELECT dep_seconds, line, headsign, next_stop FROM departures "
+                    f"WHERE stop_key = ? AND service_id IN ({placeholders}) AND dep_seconds >= ?"
+                )
+                params = [key, *services, since]
+                if line_filter:
+                    sql += " AND line = ?"
+                    params.append(line_filter)
+                sql += " ORDER BY dep_seconds LIMIT ?"
+                params.append(limit)
+                for dep_seconds, line, headsign, next_stop in conn.execute(sql, params):
+                    departures.append((midnight + timedelta(seconds=dep_seconds), line, headsign, next_stop))
+        except sqlite3.Error:
+            return None
+    departures.sort(key=lambda row: row[0])
+    return departures[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline transit timetable from a GTFS feed")
+    parser.add_argument("feed", help="GTFS zip file or unpacked directory")
+    parser.add_argument("--stop", action="append", default=[], help="only keep stops whose name contains this text")
+    parser.add_argument("--output", default=str(GTFS_INDEX_PATH), help="SQLite index to write")
+    args = parser.parse_args()
+    count = import_gtfs(args.feed, args.output, args.stop)
+    print(f"imported {count} departures")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,8 @@
-from datetime import datetime
+import argparse
+from datetime import datetime, timedelta
+from functools import lru_cache
+import os
+import threading
 import time
 import math
 from io import BytesIO
@@ -6,8 +10,8 @@ from pathlib import Path
 
 import json
 
-from plugins import TileSpec, layout_tiles, PLUGIN_DEFAULTS, PLUGIN_REGISTRY
-from utils import PALETTE_COLORS, PALETTE_IMAGE, text_size, truncate_text
+from plugins import TileSpec, layout_tiles, prefetch_tile_data, PLUGIN_DEFAULTS, PLUGIN_REGISTRY
+from utils import PALETTE_COLORS, PALETTE_IMAGE, nearest_palette_index, text_size, truncate_text
 
 from inky.auto import auto
 from PIL import Image, ImageDraw, ImageFont
@@ -32,9 +36,25 @@ class PreviewInky:
     def __init__(self, resolution):
         self.resolution = resolution
 
+
+_INKY_CACHE = {}
+_FONT_CACHE = {}
+_RENDER_LOCK = threading.Lock()
+
+
 def get_inky(upload, use_hardware_cs=True):
     if not upload:
         return PreviewInky(resolution=(EXPECTED_W, EXPECTED_H))
+    # Keep the driver (GPIO lines, SPI bus) alive across refreshes in daemon mode.
+    cache_key = bool(use_hardware_cs)
+    inky = _INKY_CACHE.get(cache_key)
+    if inky is None:
+        inky = _create_inky(use_hardware_cs)
+        _INKY_CACHE[cache_key] = inky
+    return inky
+
+
+def _create_inky(use_hardware_cs):
     try:
         inky = auto()
         if not use_hardware_cs:
@@ -146,7 +166,12 @@ PHOTO_DIR = BASE_DIR / "photos"
 CONFIG_PATH = BASE_DIR / "config.json"
 DEFAULT_CONFIG_PATH = BASE_DIR / "config.default.json"
 PRESET_DIR = BASE_DIR / ".presets"
+OUTPUT_DIR = BASE_DIR / ".generated"
 CONFIG_VERSION = 1
+# Bounded so a long-lived process cycling through layouts does not grow forever.
+PATTERN_CACHE_SIZE = 32
+MASK_CACHE_SIZE = 32
+DEFAULT_UPDATE_MINUTES = 15
 
 
 def temp_with_degree_width(draw, temp_value, font):
@@ -156,21 +181,31 @@ def temp_with_degree_width(draw, temp_value, font):
     return temp_w + 6 + (radius * 2)
 
 
+@lru_cache(maxsize=MASK_CACHE_SIZE)
+def dot_strip(count, dot, gap, vertical=False):
+    # A row of `count` square dots as one mask, so an edge is a single bitmap paste.
+    step = dot + gap
+    length = (count - 1) * step + dot + 1
+    row = ((b"\xff" * (dot + 1) + b"\x00" * (gap - 1)) * count)[:length]
+    strip = Image.frombytes("L", (length, dot + 1), row * (dot + 1))
+    return strip.transpose(Image.Transpose.TRANSPOSE) if vertical else strip
+
+
 def draw_dotted_rounded_rect(draw, bbox, radius, dot, gap, color):
     x0, y0, x1, y1 = bbox
     step = dot + gap
     # Top and bottom edges
-    x = x0 + radius
-    while x < x1 - radius:
-        draw.rectangle((x, y0, x + dot, y0 + dot), fill=color)
-        draw.rectangle((x, y1 - dot, x + dot, y1), fill=color)
-        x += step
+    count = max(0, math.ceil((x1 - radius - (x0 + radius)) / step))
+    if count:
+        strip = dot_strip(count, dot, gap)
+        draw.bitmap((x0 + radius, y0), strip, fill=color)
+        draw.bitmap((x0 + radius, y1 - dot), strip, fill=color)
     # Left and right edges
-    y = y0 + radius
-    while y < y1 - radius:
-        draw.rectangle((x0, y, x0 + dot, y + dot), fill=color)
-        draw.rectangle((x1 - dot, y, x1, y + dot), fill=color)
-        y += step
+    count = max(0, math.ceil((y1 - radius - (y0 + radius)) / step))
+    if count:
+        strip = dot_strip(count, dot, gap, vertical=True)
+        draw.bitmap((x0, y0 + radius), strip, fill=color)
+        draw.bitmap((x1 - dot, y0 + radius), strip, fill=color)
     # Rounded corners with even dot spacing along the arc
     if radius > 0:
         angle_step = step / radius
@@ -215,47 +250,97 @@ def draw_rounded_rect_outline(draw, bbox, radius, color, width=1):
         draw.line((ox1, oy0 + r, ox1, oy1 - r), fill=color)
 
 
+BAYER_4X4 = (
+    (0, 8, 2, 10),
+    (12, 4, 14, 6),
+    (3, 11, 1, 9),
+    (15, 7, 13, 5),
+)
+
+
 def create_dither_pattern(size, color_a, color_b, step=2, ratio=0.5):
     width, height = size
-    pattern = Image.new("RGB", size, color_a)
-    pixels = pattern.load()
     block = max(1, int(step))
     ratio = max(0.0, min(1.0, float(ratio)))
-    bayer = (
-        (0, 8, 2, 10),
-        (12, 4, 14, 6),
-        (3, 11, 1, 9),
-        (15, 7, 13, 5),
+    index_a = nearest_palette_index(color_a)
+    index_b = nearest_palette_index(color_b)
+    # Build the four distinct pixel rows once as palette-index bytes, then stack them.
+    period = 4 * block
+    repeats = width // period + 1
+    rows = []
+    for bayer_row in BAYER_4X4:
+        cells = bytearray()
+        for value in bayer_row:
+            cells.extend([index_b if value / 16.0 < ratio else index_a] * block)
+        rows.append(bytes(cells * repeats)[:width])
+    data = b"".join(rows[(y // block) % 4] for y in range(height))
+    pattern = Image.frombytes("P", (width, height), data)
+    pattern.putpalette(PALETTE_IMAGE.getpalette())
+    return pattern
+
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def cached_dither_pattern(size, color_a, color_b, step, ratio):
+    return create_dither_pattern(size, color_a, color_b, step=step, ratio=ratio)
+
+
+def get_dither_pattern(size, color_a, color_b, step=2, ratio=0.5):
+    # Shared between tiles: callers must paste the result, never draw on it.
+    return cached_dither_pattern(
+        tuple(size),
+        tuple(color_a),
+        tuple(color_b),
+        max(1, int(step)),
+        max(0.0, min(1.0, float(ratio))),
     )
-    for y in range(height):
-        for x in range(width):
-            tx = (x // block) % 4
-            ty = (y // block) % 4
-            threshold = bayer[ty][tx] / 16.0
-            if threshold < ratio:
-                pixels[x, y] = color_b
-    return pattern.quantize(palette=PALETTE_IMAGE, dither=Image.NONE)
+
+
+@lru_cache(maxsize=MASK_CACHE_SIZE)
+def outline_mask(size, bbox, radius, width):
+    mask = Image.new("L", size, 0)
+    mask_draw = ImageDraw.Draw(mask)
+    if radius > 0 and hasattr(mask_draw, "rounded_rectangle"):
+        mask_draw.rounded_rectangle(bbox, radius=radius, outline=255, width=width)
+    else:
+        mask_draw.rectangle(bbox, outline=255, width=width)
+    return mask
+
+
+@lru_cache(maxsize=MASK_CACHE_SIZE)
+def dotted_outline_mask(size, bbox, radius, dot, gap):
+    mask = Image.new("L", size, 0)
+    draw_dotted_rounded_rect(ImageDraw.Draw(mask), bbox, radius, dot, gap, 255)
+    return mask
+
+
+@lru_cache(maxsize=MASK_CACHE_SIZE)
+def rounded_mask(size, radius):
+    w, h = size
+    mask = Image.new("L", (w, h), 0)
+    mask_draw = ImageDraw.Draw(mask)
+    mask_draw.rounded_rectangle((0, 0, w, h), radius=radius, fill=255)
+    return mask
 
 
 def apply_dither_rect(img, bbox, color_a, color_b, step=2, ratio=0.5):
     x0, y0, x1, y1 = bbox
     width = max(1, x1 - x0 + 1)
     height = max(1, y1 - y0 + 1)
-    pattern = create_dither_pattern((width, height), color_a, color_b, step=step, ratio=ratio)
+    pattern = get_dither_pattern((width, height), color_a, color_b, step=step, ratio=ratio)
     img.paste(pattern, (x0, y0))
 
 
 def apply_dither_outline(img, bbox, radius, width, color_a, color_b, step=2, ratio=0.5):
-    mask = Image.new("L", img.size, 0)
-    mask_draw = ImageDraw.Draw(mask)
-    if radius > 0 and hasattr(mask_draw, "rounded_rectangle"):
-        mask_draw.rounded_rectangle(bbox, radius=radius, outline=255, width=width)
-    else:
-        mask_draw.rectangle(bbox, outline=255, width=width)
-    pattern = create_dither_pattern(img.size, color_a, color_b, step=step, ratio=ratio)
+    mask = outline_mask(img.size, tuple(bbox), radius, width)
+    pattern = get_dither_pattern(img.size, color_a, color_b, step=step, ratio=ratio)
     img.paste(pattern, (0, 0), mask)
 
 
+def apply_dotted_outline(img, bbox, radius, dot, gap, color):
+    mask = dotted_outline_mask(img.size, tuple(bbox), radius, dot, gap)
+    img.paste(color, (0, 0) + img.size, mask)
+
+
 def load_photo_for_box(box_size):
     if not PHOTO_DIR.exists():
         return None
@@ -293,11 +378,8 @@ def apply_rounded_mask(img, radius):
     if radius <= 0:
         return img
     w, h = img.size
-    mask = Image.new("L", (w, h), 0)
-    mask_draw = ImageDraw.Draw(mask)
-    mask_draw.rounded_rectangle((0, 0, w, h), radius=radius, fill=255)
     rounded = Image.new("RGBA", (w, h))
-    rounded.paste(img.convert("RGBA"), (0, 0), mask)
+    rounded.paste(img.convert("RGBA"), (0, 0), rounded_mask((w, h), radius))
     return rounded
 
 
@@ -388,6 +470,7 @@ def _default_config_raw():
     return {
         "update_interval_minutes": 15,
         "update_schedule": "*/15 * * * *",
+        "update_mode": "cron",
         "inky": {
             "use_hardware_cs": False,
         },
@@ -549,6 +632,19 @@ def wrap_text(draw, text, max_width, font):
     return [truncate_text(draw, line, max_width, font) for line in lines]
 
 
+def load_font(path, size):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    cache_key = (path, size, mtime)
+    font = _FONT_CACHE.get(cache_key)
+    if font is None:
+        font = ImageFont.truetype(path, size)
+        _FONT_CACHE[cache_key] = font
+    return font
+
+
 def draw_tile_error(ctx, bbox, message):
     draw = ctx["draw"]
     inky = ctx["inky"]
@@ -619,11 +715,11 @@ def render_dashboard(config=None, output_path=None, upload=False):
                             break
         else:
             font_path = font_paths["monogram-extended"]
-        font_title = ImageFont.truetype(font_path, font_sizes["title"])
-        font_sub = ImageFont.truetype(font_path, font_sizes["sub"])
-        font_body = ImageFont.truetype(font_path, font_sizes["body"])
-        font_temp = ImageFont.truetype(font_path, font_sizes["temp"])
-        font_meta = ImageFont.truetype(font_path, font_sizes["meta"])
+        font_title = load_font(font_path, font_sizes["title"])
+        font_sub = load_font(font_path, font_sizes["sub"])
+        font_body = load_font(font_path, font_sizes["body"])
+        font_temp = load_font(font_path, font_sizes["temp"])
+        font_meta = load_font(font_path, font_sizes["meta"])
     except OSError:
         font_title = ImageFont.load_default()
         font_sub = ImageFont.load_default()
@@ -792,7 +888,13 @@ def render_dashboard(config=None, output_path=None, upload=False):
     border_dither_step = int(border_cfg.get("dither_step", 2)) if border_cfg.get("dither_step") is not None else 2
     border_dither_ratio = border_ratio if border_is_hex and not border_cfg.get("dither") else border_cfg.get("dither_ratio", 0.5)
 
-    for spec, bbox in layout_tiles(layout_area, cols=cols, rows=rows, gutter=gutter, tile_layout=tiles):
+    placed_tiles = layout_tiles(layout_area, cols=cols, rows=rows, gutter=gutter, tile_layout=tiles)
+    if ctx["preview_stub"]:
+        tile_data = [None] * len(placed_tiles)
+    else:
+        tile_data = prefetch_tile_data([spec for spec, _ in placed_tiles])
+
+    for (spec, bbox), data in zip(placed_tiles, tile_data):
         left, top, right, bottom = bbox
         tile_w = max(1, right - left + 1)
         tile_h = max(1, bottom - top + 1)
@@ -816,6 +918,7 @@ def render_dashboard(config=None, output_path=None, upload=False):
             **ctx,
             "img": tile_img,
             "draw": tile_draw,
+            "data": data,
         }
 
         renderer = PLUGIN_REGISTRY.get(spec.plugin)
@@ -833,7 +936,7 @@ def render_dashboard(config=None, output_path=None, upload=False):
             if border_style == "dotted":
                 dot = max(1, tile_border_width)
                 gap = max(1, tile_border_width)
-                draw_dotted_rounded_rect(tile_draw, tile_bbox, tile_radius, dot, gap, border_color)
+                apply_dotted_outline(tile_img, tile_bbox, tile_radius, dot, gap, border_color)
             else:
                 if border_dither:
                     apply_dither_outline(
@@ -871,10 +974,134 @@ def render_dashboard(config=None, output_path=None, upload=False):
     return img
 
 
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+}
+CRON_FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+# Far enough ahead for any date a valid schedule can name (e.g. 29 Feb).
+CRON_SEARCH_DAYS = 4 * 366
+
+
+def refresh_schedule(cfg):
+    # The cron line update_cron would install for this config.
+    minutes = cfg.get("update_interval_minutes")
+    if minutes is not None:
+        try:
+            minutes = max(1, int(minutes))
+        except (TypeError, ValueError):
+            minutes = DEFAULT_UPDATE_MINUTES
+        return "* * * * *" if minutes == 1 else f"*/{minutes} * * * *"
+    schedule = str(cfg.get("update_schedule") or "").strip()
+    return schedule or f"*/{DEFAULT_UPDATE_MINUTES} * * * *"
+
+
+def _cron_field(text, low, high):
+    values = set()
+    for part in text.split(","):
+        part, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(value) for value in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f"Cron field out of range: {text}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(schedule):
+    # Returns None for schedules the daemon cannot follow (names, @reboot, typos).
+    schedule = CRON_ALIASES.get(schedule.strip().lower(), schedule)
+    parts = schedule.split()
+    if len(parts) != 5:
+        return None
+    try:
+        minutes, hours, days, months, weekdays = (
+            _cron_field(part, low, high) for part, (low, high) in zip(parts, CRON_FIELD_RANGES)
+        )
+    except ValueError:
+        return None
+    weekdays = {day % 7 for day in weekdays}
+    return sorted(minutes), sorted(hours), days, months, weekdays, parts[2] == "*", parts[4] == "*"
+
+
+def next_refresh_time(cfg, now=None):
+    fields = parse_cron(refresh_schedule(cfg))
+    if fields is None:
+        return None
+    minutes, hours, days, months, weekdays, any_day, any_weekday = fields
+    now = now or datetime.now()
+    start = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    for offset in range(CRON_SEARCH_DAYS):
+        day = start.date() + timedelta(days=offset)
+        if day.month not in months:
+            continue
+        day_match = day.day in days
+        weekday_match = (day.weekday() + 1) % 7 in weekdays
+        # Like cron: when both day fields are restricted, either one may match.
+        if any_day or any_weekday:
+            matches = day_match and weekday_match
+        else:
+            matches = day_match or weekday_match
+        if not matches:
+            continue
+        for hour in hours:
+            for minute in minutes:
+                candidate = datetime(day.year, day.month, day.day, hour, minute)
+                if candidate >= start:
+                    return candidate
+    return None
+
+
+def refresh_display(cfg, output_path=None):
+    output_path = output_path or OUTPUT_DIR / "dashboard.png"
+    with _RENDER_LOCK:
+        return render_dashboard(cfg, output_path=output_path, upload=True)
+
+
+def run_daemon(stop_event=None, reschedule_event=None):
+    stop_event = stop_event or threading.Event()
+    reschedule_event = reschedule_event or threading.Event()
+    while not stop_event.is_set():
+        next_time = next_refresh_time(load_config())
+        if next_time is None:
+            print("schedule cannot be followed in daemon mode; use cron")
+            return
+        # A reschedule (config saved) only recomputes the wait; refreshing on
+        # demand is left to /api/apply.
+        if reschedule_event.wait(max(0.0, (next_time - datetime.now()).total_seconds())):
+            reschedule_event.clear()
+            continue
+        if stop_event.is_set():
+            break
+        try:
+            refresh_display(load_config())
+            print(f"refreshed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        except Exception as exc:
+            print(f"refresh failed: {exc}")
+
+
 def main():
-    cfg = load_config()
-    output_dir = Path(__file__).resolve().parent / ".generated"
-    render_dashboard(cfg, output_path=output_dir / "dashboard.png", upload=True)
+    parser = argparse.ArgumentParser(description="Render the dashboard to the Inky display")
+    parser.add_argument("--daemon", action="store_true", help="stay resident and refresh on the configured schedule")
+    args = parser.parse_args()
+    if args.daemon:
+        try:
+            run_daemon()
+        except KeyboardInterrupt:
+            pass
+        return
+    refresh_display(load_config())
     print("done")
 
 
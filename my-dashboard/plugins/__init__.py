@@ -1,10 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from typing import Dict, List, Tuple
 
-from .calendar import CALENDAR_SCHEMA, DEFAULT_CALENDAR_CONFIG, draw_calendar_tile
+from .calendar import CALENDAR_SCHEMA, DEFAULT_CALENDAR_CONFIG, draw_calendar_tile, fetch_calendar_tile
 from .photo import DEFAULT_PHOTO_CONFIG, PHOTO_SCHEMA, draw_photo_tile
-from .transit import DEFAULT_TRANSIT_CONFIG, TRANSIT_SCHEMA, draw_transit_tile
-from .weather import DEFAULT_WEATHER_CONFIG, WEATHER_SCHEMA, draw_weather_tile
+from .transit import DEFAULT_TRANSIT_CONFIG, TRANSIT_SCHEMA, draw_transit_tile, fetch_transit_tile
+from .weather import (
+    DEFAULT_WEATHER_CONFIG,
+    WEATHER_SCHEMA,
+    draw_weather_tile,
+    fetch_weather_tile,
+    register_weather_locations,
+    weather_location,
+)
+
+PREFETCH_WORKERS = 4
 
 
 @dataclass
@@ -45,6 +55,45 @@ PLUGIN_REGISTRY = {
     "weather": draw_weather_tile,
 }
 
+# Optional data step run concurrently for all tiles before any drawing starts.
+# The result is handed to the renderer as ctx["data"].
+PLUGIN_FETCHERS = {
+    "calendar": fetch_calendar_tile,
+    "transit": fetch_transit_tile,
+    "weather": fetch_weather_tile,
+}
+
+# Forecast location each plugin draws, registered up front so the first tile
+# to need weather fetches every location of the layout in one request.
+WEATHER_LOCATIONS = {
+    "calendar": lambda config: weather_location({}),
+    "weather": weather_location,
+}
+
+
+def prefetch_tile_data(specs, max_workers=PREFETCH_WORKERS):
+    results = [None] * len(specs)
+    register_weather_locations(
+        [WEATHER_LOCATIONS[spec.plugin](spec.config) for spec in specs if spec.plugin in WEATHER_LOCATIONS]
+    )
+    jobs = [
+        (idx, PLUGIN_FETCHERS[spec.plugin], spec.config)
+        for idx, spec in enumerate(specs)
+        if spec.plugin in PLUGIN_FETCHERS
+    ]
+    if not jobs:
+        return results
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+        futures = [(idx, pool.submit(fetch, config)) for idx, fetch, config in jobs]
+        for idx, future in futures:
+            try:
+                results[idx] = future.result()
+            except Exception:
+                # Leave it to the renderer to fetch inline and report the error.
+                results[idx] = None
+    return results
+
+
 PLUGIN_DEFAULTS = {
     "calendar": DEFAULT_CALENDAR_CONFIG,
     "photo": DEFAULT_PHOTO_CONFIG,
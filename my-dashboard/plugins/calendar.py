@@ -1,13 +1,25 @@
-from datetime import date, datetime, time, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+import hashlib
+import heapq
+from itertools import accumulate, groupby
+import json
+import mmap
 import os
+import sqlite3
+import threading
 import time as time_mod
-from urllib.parse import quote
+from urllib.error import HTTPError
+from urllib.parse import quote, urlencode
 
 from icalendar import Calendar
+from PIL import Image
 import recurring_ical_events
 
-from utils import fetch_json, text_size, truncate_text
-from .weather import get_berlin_weather, draw_weather_icon
+from snapshots import read_snapshot
+from utils import CACHE_DIR, draw_stale_marker, http_request, text_size, truncate_text
+from .weather import get_weather_snapshot, draw_weather_icon
 
 
 DEFAULT_CALENDAR_CONFIG = {
@@ -23,6 +35,31 @@ DEFAULT_CALENDAR_CONFIG = {
 
 _CAL_CACHE = {}
 _CAL_CACHE_TTL = 300
+CALENDAR_SNAPSHOT_TTL = 600
+# All sources load in parallel; any source still loading at the deadline is
+# drawn from its last good copy.
+CALENDAR_FETCH_DEADLINE = 8
+_LAST_GOOD_EVENTS = {}
+# Downloaded .ics bodies and their ETag/Last-Modified validators, kept across runs.
+ICAL_CACHE_DIR = CACHE_DIR / "ical"
+_PARSED_EVENTS = {}
+_PARSED_EVENTS_MAX = 32
+# Expanded occurrences per (content hash, timezone, day), so unchanged calendars
+# and windows that slide by a day only expand the days not seen before.
+CALENDAR_CACHE_PATH = CACHE_DIR / "calendar_cache.sqlite3"
+EXPANSION_MAX_AGE_SECONDS = 14 * 24 * 3600
+_CALENDAR_DB = None
+_CALENDAR_DB_LOCK = threading.Lock()
+# Google calendars are mirrored locally and kept current with syncToken.
+GOOGLE_CALENDAR_API = "https://www.googleapis.com/calendar/v3"
+GOOGLE_EVENT_FIELDS = "items(id,status,summary,start,end),nextPageToken,nextSyncToken"
+GOOGLE_PAGE_SIZE = 2500
+GOOGLE_SYNC_LOOKBACK_DAYS = 31
+# One lock per calendar, so different calendars still sync in parallel.
+_GOOGLE_SYNC_LOCKS = {}
+# Fetched events are also stored per (source, day), so a fresh process or a
+# different view only reads the days it shows instead of fetching again.
+EVENT_STORE_MAX_AGE_SECONDS = 7 * 24 * 3600
 
 CALENDAR_SCHEMA = {
     "view": {"type": "enum", "label": "View", "options": ["month", "week", "day"]},
@@ -98,6 +135,59 @@ def normalize_datetime(dt, tzinfo):
     return None
 
 
+class CalendarEvent:
+    # One record per occurrence; all-day events keep their whole span
+    # (inclusive first and last date) instead of one copy per day.
+    __slots__ = ("start", "end", "title", "calendar", "all_day", "color")
+
+    def __init__(self, start, end, title, calendar=None, all_day=False, color=None):
+        if all_day and end < start:
+            end = start
+        self.start = start
+        self.end = end
+        self.title = title
+        self.calendar = calendar
+        self.all_day = all_day
+        self.color = color
+
+    def covers(self, day):
+        return self.start <= day <= self.end
+
+
+class EventDayIndex:
+    # Maps events to days on demand, so long all-day spans are only placed on
+    # the days a view actually draws.
+    __slots__ = ("_all_day", "_timed", "_days")
+
+    def __init__(self, events, tzinfo):
+        self._all_day = []
+        self._timed = {}
+        self._days = {}
+        for event in events:
+            if event.all_day:
+                self._all_day.append(event)
+                continue
+            start = event.start
+            if isinstance(start, datetime):
+                day = start.astimezone(tzinfo).date() if tzinfo else start.date()
+            else:
+                day = start
+            self._timed.setdefault(day, []).append(event)
+        for day_events in self._timed.values():
+            day_events.sort(key=lambda e: e.start)
+
+    def get(self, day, default=None):
+        events = self._days.get(day)
+        if events is None:
+            events = [event for event in self._all_day if event.covers(day)]
+            events.extend(self._timed.get(day, ()))
+            self._days[day] = events
+        return events
+
+    def timed_events(self):
+        return [event for day_events in self._timed.values() for event in day_events]
+
+
 def expand_event_dates(start_date, end_date):
     if end_date <= start_date:
         return [start_date]
@@ -109,9 +199,79 @@ def expand_event_dates(start_date, end_date):
     return days
 
 
+def _ical_line_date(line):
+    value = line.rsplit(":", 1)[-1].strip()
+    try:
+        return date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+    except ValueError:
+        return None
+
+
+def _vevent_may_overlap(block, first_day, last_day):
+    start = end = None
+    open_ended = False
+    for line in block.replace("\r\n ", "").replace("\r\n\t", "").replace("\n ", "").replace("\n\t", "").splitlines():
+        name = line.split(":", 1)[0].split(";", 1)[0].upper()
+        if name in ("RRULE", "RDATE", "EXRULE", "RECURRENCE-ID"):
+            # Recurring series and their overrides are left to recurring_ical_events.
+            return True
+        if name == "DTSTART" and start is None:
+            start = _ical_line_date(line)
+        elif name == "DTEND" and end is None:
+            end = _ical_line_date(line)
+        elif name == "DURATION":
+            open_ended = True
+    if start is None:
+        return True
+    if start > last_day:
+        return False
+    if end is None and open_ended:
+        return True
+    return (end or start) >= first_day
+
+
+def prefilter_ical(data, start_dt, end_dt):
+    # Drop one-off VEVENTs that lie clearly outside the window before icalendar sees them.
+    # A day of margin on each side covers timezone offsets. Works on str, bytes or mmap.
+    binary = not isinstance(data, str)
+    begin, finish = (b"BEGIN:VEVENT", b"END:VEVENT") if binary else ("BEGIN:VEVENT", "END:VEVENT")
+    first_day = start_dt.date() - timedelta(days=1)
+    last_day = end_dt.date() + timedelta(days=1)
+    parts = []
+    pos = 0
+    while True:
+        idx = data.find(begin, pos)
+        if idx < 0:
+            parts.append(data[pos:])
+            break
+        parts.append(data[pos:idx])
+        stop = data.find(finish, idx)
+        if stop < 0:
+            parts.append(data[idx:])
+            break
+        stop += len(finish)
+        block = data[idx:stop]
+        if binary:
+            block = block.decode("utf-8", errors="ignore")
+        if _vevent_may_overlap(block, first_day, last_day):
+            parts.append(block)
+        pos = stop
+    return "".join(part.decode("utf-8", errors="ignore") if isinstance(part, bytes) else part for part in parts)
+
+
 def parse_ical_events(ical_text, tzinfo, start_dt, end_dt, cal_name=None, color=None):
-    cal = Calendar.from_ical(ical_text)
-    events = []
+    return calendar_events(Calendar.from_ical(ical_text), tzinfo, start_dt, end_dt, cal_name, color)
+
+
+def calendar_events(cal, tzinfo, start_dt, end_dt, cal_name=None, color=None):
+    return occurrence_events(ical_occurrences(cal, tzinfo, start_dt, end_dt), cal_name, color)
+
+
+def ical_occurrences(cal, tzinfo, start_dt, end_dt):
+    # Yields (start, end, title, all_day, occurrence_id); all-day spans keep their
+    # first and last date. The id (UID plus recurrence start) tells apart distinct
+    # events that happen to share start, end and title.
+    seen = {}
     for event in recurring_ical_events.of(cal).between(start_dt, end_dt):
         summary = str(event.get("summary") or "Untitled")
         dtstart = event.get("dtstart")
@@ -120,34 +280,25 @@ def parse_ical_events(ical_text, tzinfo, start_dt, end_dt, cal_name=None, color=
             continue
         dtstart = dtstart.dt
         dtend = dtend.dt if dtend else None
+        occurrence_id = f"{event.get('uid') or ''}|{dtstart.isoformat()}"
+        seen[occurrence_id] = seen.get(occurrence_id, 0) + 1
+        if seen[occurrence_id] > 1:
+            occurrence_id = f"{occurrence_id}#{seen[occurrence_id]}"
         if isinstance(dtstart, date) and not isinstance(dtstart, datetime):
             start_date = dtstart
             end_date = dtend - timedelta(days=1) if isinstance(dtend, date) else start_date
-            for day in expand_event_dates(start_date, end_date):
-                events.append(
-                    {
-                        "start": day,
-                        "end": day,
-                        "title": summary,
-                        "calendar": cal_name,
-                        "all_day": True,
-                        "color": color,
-                    }
-                )
+            yield start_date, end_date, summary, True, occurrence_id
             continue
         start_dt_norm = normalize_datetime(dtstart, tzinfo)
         end_dt_norm = normalize_datetime(dtend, tzinfo) if dtend else start_dt_norm
-        events.append(
-            {
-                "start": start_dt_norm,
-                "end": end_dt_norm,
-                "title": summary,
-                "calendar": cal_name,
-                "all_day": False,
-                "color": color,
-            }
-        )
-    return events
+        yield start_dt_norm, end_dt_norm, summary, False, occurrence_id
+
+
+def occurrence_events(occurrences, cal_name=None, color=None):
+    return [
+        CalendarEvent(start, end, title, cal_name, all_day, color)
+        for start, end, title, all_day, _ in occurrences
+    ]
 
 
 def parse_google_events(items, tzinfo, cal_name=None, color=None):
@@ -161,120 +312,563 @@ def parse_google_events(items, tzinfo, cal_name=None, color=None):
         if "date" in start:
             start_date = date.fromisoformat(start["date"])
             end_date = date.fromisoformat(end.get("date", start["date"])) - timedelta(days=1)
-            for day in expand_event_dates(start_date, end_date):
-                events.append(
-                    {
-                        "start": day,
-                        "end": day,
-                        "title": summary,
-                        "calendar": cal_name,
-                        "all_day": True,
-                        "color": color,
-                    }
-                )
+            events.append(CalendarEvent(start_date, end_date, summary, cal_name, True, color))
             continue
         if "dateTime" in start:
             start_dt = datetime.fromisoformat(start["dateTime"])
             end_dt = datetime.fromisoformat(end.get("dateTime", start["dateTime"]))
             start_dt = normalize_datetime(start_dt, tzinfo)
             end_dt = normalize_datetime(end_dt, tzinfo)
-            events.append(
-                {
-                    "start": start_dt,
-                    "end": end_dt,
-                    "title": summary,
-                    "calendar": cal_name,
-                    "all_day": False,
-                    "color": color,
-                }
+            events.append(CalendarEvent(start_dt, end_dt, summary, cal_name, False, color))
+    return events
+
+
+def _google_list(calendar_id, api_key, params):
+    items = []
+    page_token = None
+    while True:
+        query = {**params, "fields": GOOGLE_EVENT_FIELDS, "maxResults": GOOGLE_PAGE_SIZE, "key": api_key}
+        if page_token:
+            query["pageToken"] = page_token
+        url = f"{GOOGLE_CALENDAR_API}/calendars/{quote(calendar_id)}/events?{urlencode(query)}"
+        _, body = http_request(url, timeout=10)
+        payload = json.loads(body)
+        items.extend(payload.get("items") or [])
+        page_token = payload.get("nextPageToken")
+        if not page_token:
+            return items, payload.get("nextSyncToken")
+
+
+def _google_item_bounds(item):
+    start = item.get("start") or {}
+    end = item.get("end") or {}
+    try:
+        if "date" in start:
+            start_ts = datetime.combine(date.fromisoformat(start["date"]), time.min, timezone.utc).timestamp()
+            end_ts = datetime.combine(date.fromisoformat(end.get("date", start["date"])), time.min, timezone.utc).timestamp()
+        else:
+            start_ts = datetime.fromisoformat(start["dateTime"]).timestamp()
+            end_ts = datetime.fromisoformat(end.get("dateTime", start["dateTime"])).timestamp()
+    except (KeyError, ValueError):
+        return None
+    return start_ts, max(start_ts, end_ts)
+
+
+def sync_google_calendar(calendar_id, api_key, start_dt):
+    with _CALENDAR_DB_LOCK:
+        sync_lock = _GOOGLE_SYNC_LOCKS.setdefault(calendar_id, threading.Lock())
+    with sync_lock:
+        with _CALENDAR_DB_LOCK:
+            state = _calendar_db().execute(
+                "SELECT sync_token, time_min FROM google_sync WHERE calendar_id = ?",
+                (calendar_id,),
+            ).fetchone()
+        items = None
+        time_min = state[1] if state else None
+        if state and state[0] and time_min <= start_dt.timestamp():
+            try:
+                # Only events changed since the last sync, deletions included.
+                items, sync_token = _google_list(calendar_id, api_key, {"singleEvents": "true", "syncToken": state[0]})
+            except HTTPError as exc:
+                if exc.code != 410:
+                    raise
+        full = items is None
+        if full:
+            # 410 Gone, no token yet, or the window moved before the mirrored range.
+            horizon = (start_dt - timedelta(days=GOOGLE_SYNC_LOOKBACK_DAYS)).astimezone()
+            time_min = horizon.timestamp()
+            items, sync_token = _google_list(
+                calendar_id,
+                api_key,
+                {"singleEvents": "true", "timeMin": horizon.isoformat()},
+            )
+        with _CALENDAR_DB_LOCK:
+            conn = _calendar_db()
+            with conn:
+                if full:
+                    conn.execute("DELETE FROM google_events WHERE calendar_id = ?", (calendar_id,))
+                for item in items:
+                    bounds = _google_item_bounds(item)
+                    if item.get("status") == "cancelled" or not bounds:
+                        conn.execute(
+                            "DELETE FROM google_events WHERE calendar_id = ? AND event_id = ?",
+                            (calendar_id, item.get("id")),
+                        )
+                        continue
+                    conn.execute(
+                        "INSERT OR REPLACE INTO google_events (calendar_id, event_id, start_ts, end_ts, item) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (calendar_id, item.get("id"), bounds[0], bounds[1], json.dumps(item)),
+                    )
+                conn.execute(
+                    "INSERT OR REPLACE INTO google_sync (calendar_id, sync_token, time_min, synced_at) VALUES (?, ?, ?, ?)",
+                    (calendar_id, sync_token, time_min, time_mod.time()),
+                )
+
+
+def google_calendar_events(calendar_id, api_key, tzinfo, start_dt, end_dt, cal_name=None, color=None):
+    sync_google_calendar(calendar_id, api_key, start_dt)
+    # All-day bounds are stored in UTC, so allow a day of slack before the exact filter.
+    with _CALENDAR_DB_LOCK:
+        rows = _calendar_db().execute(
+            "SELECT item FROM google_events WHERE calendar_id = ? AND start_ts < ? AND end_ts > ? "
+            "ORDER BY start_ts, event_id",
+            (calendar_id, end_dt.timestamp() + 86400, start_dt.timestamp() - 86400),
+        ).fetchall()
+    items = [json.loads(row[0]) for row in rows]
+    events = parse_google_events(items, tzinfo, cal_name=cal_name, color=color)
+    return events_in_window(events, tzinfo, start_dt, end_dt)
+
+
+def _ical_cache_paths(url):
+    name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return ICAL_CACHE_DIR / f"{name}.ics", ICAL_CACHE_DIR / f"{name}.json"
+
+
+def _read_ical_cache(url):
+    body_path, meta_path = _ical_cache_paths(url)
+    try:
+        meta = json.loads(meta_path.read_text())
+        body = body_path.read_bytes()
+    except (OSError, ValueError):
+        return None
+    return {**meta, "data": body}
+
+
+def _write_ical_cache(url, entry):
+    body_path, meta_path = _ical_cache_paths(url)
+    meta = {key: value for key, value in entry.items() if key != "data"}
+    try:
+        ICAL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        if entry.get("data") is not None:
+            tmp_path = body_path.with_suffix(".tmp")
+            tmp_path.write_bytes(entry["data"])
+            os.replace(tmp_path, body_path)
+        tmp_path = meta_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, meta_path)
+    except OSError:
+        pass
+
+
+def load_ical_url(url):
+    # Returns (body, version); version only changes when the server sends a new body.
+    cache_key = f"url:{url}"
+    cached = _CAL_CACHE.get(cache_key)
+    if cached is None:
+        cached = _read_ical_cache(url)
+    if cached and cached.get("data") is not None and time_mod.time() - cached["ts"] < _CAL_CACHE_TTL:
+        _CAL_CACHE[cache_key] = cached
+    else:
+        headers = {"Accept": "text/calendar, */*"}
+        if cached and cached.get("data") is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        try:
+            response, body = http_request(url, timeout=10, headers=headers)
+        except Exception:
+            response, body = None, None
+        if response is not None and response.status == 304 and cached:
+            cached = {**cached, "ts": time_mod.time()}
+            _write_ical_cache(url, {key: value for key, value in cached.items() if key != "data"})
+        elif response is not None:
+            cached = {
+                "ts": time_mod.time(),
+                "data": body,
+                "etag": response.getheader("ETag"),
+                "last_modified": response.getheader("Last-Modified"),
+                "version": f"{time_mod.time():.6f}",
+            }
+            _write_ical_cache(url, cached)
+        else:
+            # Keep serving the last body and its validators, but retry on the next render.
+            cached = {**(cached or {"data": None}), "ts": 0}
+        _CAL_CACHE[cache_key] = cached
+    # Raw bytes: prefilter_ical decodes only the events that can be visible.
+    return cached.get("data"), cached.get("version")
+
+
+def _calendar_db():
+    global _CALENDAR_DB
+    if _CALENDAR_DB is None:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(CALENDAR_CACHE_PATH), timeout=5, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS expansions ("
+            "content_hash TEXT, tz TEXT, day TEXT, stored_at REAL, events TEXT, "
+            "PRIMARY KEY (content_hash, tz, day))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS google_events ("
+            "calendar_id TEXT, event_id TEXT, start_ts REAL, end_ts REAL, item TEXT, "
+            "PRIMARY KEY (calendar_id, event_id))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS google_events_by_start ON google_events (calendar_id, start_ts)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS google_sync ("
+            "calendar_id TEXT PRIMARY KEY, sync_token TEXT, time_min REAL, synced_at REAL)"
+        )
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'stored_events'").fetchone():
+            # day_events replaced stored_events, which could not hold identical events;
+            # forget the stored days too so they are fetched again.
+            conn.execute("DROP TABLE stored_events")
+            conn.execute("DROP TABLE IF EXISTS stored_days")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS day_events ("
+            "source TEXT, day TEXT, event TEXT, seq INTEGER, pos INTEGER, "
+            "PRIMARY KEY (source, day, event, seq))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS stored_days ("
+            "source TEXT, day TEXT, stored_at REAL, "
+            "PRIMARY KEY (source, day))"
+        )
+        conn.commit()
+        _CALENDAR_DB = conn
+    return _CALENDAR_DB
+
+
+def _encode_when(value):
+    return [value.isoformat(), isinstance(value, datetime)]
+
+
+def _decode_when(value, tzinfo):
+    text, is_datetime = value
+    return normalize_datetime(datetime.fromisoformat(text), tzinfo) if is_datetime else date.fromisoformat(text)
+
+
+def _occurrence_days(start, end, all_day, tzinfo):
+    if all_day:
+        return expand_event_dates(start, end)
+    first = start.astimezone(tzinfo).date() if tzinfo else start.date()
+    last = (end - timedelta(microseconds=1)).astimezone(tzinfo).date() if tzinfo else end.date()
+    return expand_event_dates(first, max(first, last))
+
+
+def expand_ical_cached(ical_data, tzinfo, start_dt, end_dt):
+    days = expand_event_dates(start_dt.date(), (end_dt - timedelta(microseconds=1)).date())
+    if isinstance(ical_data, str):
+        ical_data = ical_data.encode("utf-8", errors="ignore")
+    content_hash = hashlib.sha1(ical_data).hexdigest()
+    tz_key = str(tzinfo)
+    cached = {}
+    try:
+        with _CALENDAR_DB_LOCK:
+            placeholders = ",".join("?" * len(days))
+            rows = _calendar_db().execute(
+                f"SELECT day, events FROM expansions WHERE content_hash = ? AND tz = ? AND day IN ({placeholders})",
+                (content_hash, tz_key, *[day.isoformat() for day in days]),
+            ).fetchall()
+        for day, payload in rows:
+            cached[date.fromisoformat(day)] = json.loads(payload)
+    except (sqlite3.Error, OSError, ValueError):
+        cached = {}
+
+    missing = [day for day in days if day not in cached]
+    if missing:
+        cal = Calendar.from_ical(
+            prefilter_ical(
+                ical_data,
+                datetime.combine(missing[0], time.min),
+                datetime.combine(missing[-1] + timedelta(days=1), time.min),
             )
+        )
+        # Expand each run of consecutive missing days with a single query.
+        runs = []
+        for day in missing:
+            if runs and runs[-1][1] + timedelta(days=1) == day:
+                runs[-1][1] = day
+            else:
+                runs.append([day, day])
+        fresh = {day: [] for day in missing}
+        for first, last in runs:
+            run_start = datetime.combine(first, time.min, start_dt.tzinfo)
+            run_end = datetime.combine(last + timedelta(days=1), time.min, start_dt.tzinfo)
+            for start, end, title, all_day, occurrence_id in ical_occurrences(cal, tzinfo, run_start, run_end):
+                record = [_encode_when(start), _encode_when(end), title, all_day, occurrence_id]
+                for day in _occurrence_days(start, end, all_day, tzinfo):
+                    if day in fresh:
+                        fresh[day].append(record)
+        cached.update(fresh)
+        now = time_mod.time()
+        try:
+            with _CALENDAR_DB_LOCK:
+                conn = _calendar_db()
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO expansions (content_hash, tz, day, stored_at, events) VALUES (?, ?, ?, ?, ?)",
+                        [
+                            (content_hash, tz_key, day.isoformat(), now, json.dumps(records))
+                            for day, records in fresh.items()
+                        ],
+                    )
+                    conn.execute("DELETE FROM expansions WHERE stored_at < ?", (now - EXPANSION_MAX_AGE_SECONDS,))
+        except (sqlite3.Error, OSError):
+            pass
+
+    occurrences = []
+    seen = set()
+    for day in days:
+        for record in cached[day]:
+            # Occurrences spanning several days are stored under each of them.
+            # Rows cached before occurrence ids existed fall back to the record itself.
+            key = record[4] if len(record) > 4 else json.dumps(record)
+            if key in seen:
+                continue
+            seen.add(key)
+            start, end, title, all_day = record[:4]
+            occurrences.append((_decode_when(start, tzinfo), _decode_when(end, tzinfo), title, all_day, key))
+    return occurrences
+
+
+def parse_ical_cached(source, version, ical_data, tzinfo, start_dt, end_dt, cal_name=None, color=None):
+    # An unchanged body (304 or same mtime) reuses the events parsed for this window.
+    key = (source, version, str(tzinfo), start_dt.isoformat(), end_dt.isoformat(), cal_name, color)
+    if version is not None and key in _PARSED_EVENTS:
+        return _PARSED_EVENTS[key]
+    if start_dt.time() == time.min and end_dt.time() == time.min:
+        events = occurrence_events(expand_ical_cached(ical_data, tzinfo, start_dt, end_dt), cal_name, color)
+    else:
+        ical_text = prefilter_ical(ical_data, start_dt, end_dt)
+        events = parse_ical_events(ical_text, tzinfo, start_dt, end_dt, cal_name=cal_name, color=color)
+    if version is not None:
+        if len(_PARSED_EVENTS) >= _PARSED_EVENTS_MAX:
+            _PARSED_EVENTS.pop(next(iter(_PARSED_EVENTS)))
+        _PARSED_EVENTS[key] = events
     return events
 
 
-def fetch_events(calendars, tzinfo, start_dt, end_dt):
-    events = []
+def calendar_sources(calendars):
     palette = ["blue", "red", "green", "orange", "yellow", "black"]
     for idx, cal in enumerate(calendars):
         if isinstance(cal, str):
             cal = {"type": "ical_url", "url": cal}
         if not isinstance(cal, dict):
             continue
-        cal_type = (cal.get("type") or "").lower()
-        cal_name = cal.get("name") or ""
         color = (cal.get("color") or "").lower() or None
         if not color:
             color = palette[idx % len(palette)]
-        if cal_type == "ical_url":
-            url = cal.get("url")
-            if not url:
-                continue
-            if url.startswith("webcal://"):
-                url = "https://" + url[len("webcal://"):]
-            cache_key = f"url:{url}"
-            cached = _CAL_CACHE.get(cache_key)
-            if cached and time_mod.time() - cached["ts"] < _CAL_CACHE_TTL:
-                ical_text = cached["data"]
-            else:
-                try:
-                    import urllib.request
-
-                    ical_text = urllib.request.urlopen(url, timeout=10).read()
-                except Exception:
-                    ical_text = None
-                _CAL_CACHE[cache_key] = {"ts": time_mod.time(), "data": ical_text}
-            if isinstance(ical_text, bytes):
-                ical_text = ical_text.decode("utf-8", errors="ignore")
-            if ical_text:
-                events.extend(parse_ical_events(ical_text, tzinfo, start_dt, end_dt, cal_name=cal_name, color=color))
-        elif cal_type == "local":
-            path = cal.get("path")
-            if not path:
-                continue
+        yield cal, color
+
+
+def fetch_source_events(cal, color, tzinfo, start_dt, end_dt):
+    # Returns None when the source could not be loaded, so callers can keep the last good copy.
+    cal_type = (cal.get("type") or "").lower()
+    cal_name = cal.get("name") or ""
+    if cal_type == "ical_url":
+        url = cal.get("url")
+        if not url:
+            return []
+        if url.startswith("webcal://"):
+            url = "https://" + url[len("webcal://"):]
+        ical_data, version = load_ical_url(url)
+        if not ical_data:
+            return None
+        return parse_ical_cached(url, version, ical_data, tzinfo, start_dt, end_dt, cal_name=cal_name, color=color)
+    if cal_type == "local":
+        path = cal.get("path")
+        if not path:
+            return []
+        try:
+            mtime = os.path.getmtime(path)
+            # Map the file instead of reading it; only candidate events get decoded.
+            with open(path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as ical_data:
+                return parse_ical_cached(path, mtime, ical_data, tzinfo, start_dt, end_dt, cal_name=cal_name, color=color)
+        except Exception:
+            return None
+    if cal_type == "google":
+        calendar_id = cal.get("calendar_id")
+        api_key = cal.get("api_key")
+        if not calendar_id or not api_key:
+            return []
+        try:
+            return google_calendar_events(calendar_id, api_key, tzinfo, start_dt, end_dt, cal_name, color)
+        except Exception:
+            return None
+    return []
+
+
+def events_in_window(events, tzinfo, start_dt, end_dt):
+    visible = []
+    for event in events:
+        start = normalize_datetime(event.start, tzinfo)
+        end = normalize_datetime(event.end, tzinfo)
+        if event.all_day:
+            end += timedelta(days=1)
+        try:
+            if start < end_dt and end > start_dt:
+                visible.append(event)
+        except TypeError:
+            visible.append(event)
+    return visible
+
+
+def event_store_key(cal, color, tzinfo):
+    return hashlib.sha1(json.dumps([cal, color, str(tzinfo)], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _window_days(start_dt, end_dt):
+    return expand_event_dates(start_dt.date(), (end_dt - timedelta(microseconds=1)).date())
+
+
+def store_source_events(source, events, tzinfo, start_dt, end_dt):
+    days = _window_days(start_dt, end_dt)
+    first, last = days[0], days[-1]
+    rows = []
+    copies = {}
+    for pos, event in enumerate(events):
+        payload = json.dumps(
+            [_encode_when(event.start), _encode_when(event.end), event.title, event.calendar, event.all_day, event.color]
+        )
+        # seq numbers identical events, so they stay apart while the same event
+        # stored by two overlapping windows still reads back once.
+        seq = copies.get(payload, 0)
+        copies[payload] = seq + 1
+        try:
+            event_days = _occurrence_days(event.start, event.end, event.all_day, tzinfo)
+        except (AttributeError, TypeError):
+            event_days = days
+        for day in event_days:
+            if first <= day <= last:
+                rows.append((source, day.isoformat(), payload, seq, pos))
+    now = time_mod.time()
+    try:
+        with _CALENDAR_DB_LOCK:
+            conn = _calendar_db()
+            with conn:
+                conn.execute(
+                    "DELETE FROM day_events WHERE source = ? AND day BETWEEN ? AND ?",
+                    (source, first.isoformat(), last.isoformat()),
+                )
+                conn.executemany("INSERT OR REPLACE INTO day_events VALUES (?, ?, ?, ?, ?)", rows)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO stored_days VALUES (?, ?, ?)",
+                    [(source, day.isoformat(), now) for day in days],
+                )
+                conn.execute("DELETE FROM stored_days WHERE stored_at < ?", (now - EVENT_STORE_MAX_AGE_SECONDS,))
+                conn.execute(
+                    "DELETE FROM day_events WHERE NOT EXISTS (SELECT 1 FROM stored_days AS d "
+                    "WHERE d.source = day_events.source AND d.day = day_events.day)"
+                )
+    except (sqlite3.Error, OSError):
+        pass
+
+
+def read_stored_events(source, start_dt, end_dt, max_age=CALENDAR_SNAPSHOT_TTL):
+    stored = read_stored_snapshot(source, start_dt, end_dt, max_age)
+    return stored[0] if stored else None
+
+
+def read_stored_snapshot(source, start_dt, end_dt, max_age=CALENDAR_SNAPSHOT_TTL):
+    # Returns (events, oldest stored_at), or None unless every requested day
+    # was stored recently enough.
+    days = _window_days(start_dt, end_dt)
+    first, last = days[0].isoformat(), days[-1].isoformat()
+    try:
+        with _CALENDAR_DB_LOCK:
+            conn = _calendar_db()
+            fresh, stored_at = conn.execute(
+                "SELECT COUNT(*), MIN(stored_at) FROM stored_days "
+                "WHERE source = ? AND day BETWEEN ? AND ? AND stored_at >= ?",
+                (source, first, last, time_mod.time() - max_age),
+            ).fetchone()
+            if fresh < len(days):
+                return None
+            # Events spanning several days are stored under each of them.
+            rows = conn.execute(
+                "SELECT MIN(pos), event FROM day_events WHERE source = ? AND day BETWEEN ? AND ? "
+                "GROUP BY event, seq ORDER BY MIN(pos)",
+                (source, first, last),
+            ).fetchall()
+    except (sqlite3.Error, OSError):
+        return None
+    events = []
+    for _, payload in rows:
+        start, end, title, calendar, all_day, color = json.loads(payload)
+        events.append(
+            CalendarEvent(_decode_when(start, None), _decode_when(end, None), title, calendar, all_day, color)
+        )
+    return events, stored_at
+
+
+def load_source_snapshot(cal, color, tzinfo, start_dt, end_dt):
+    if (cal.get("type") or "").lower() == "local":
+        # Local files are cheap to check and should show edits right away.
+        return fetch_source_events(cal, color, tzinfo, start_dt, end_dt), None, False
+    source = event_store_key(cal, color, tzinfo)
+    stored = read_stored_events(source, start_dt, end_dt)
+    if stored is not None:
+        return stored, None, False
+
+    def load():
+        events = fetch_source_events(cal, color, tzinfo, start_dt, end_dt)
+        if events is not None:
+            store_source_events(source, events, tzinfo, start_dt, end_dt)
+        return events
+
+    key = ("calendar", json.dumps(cal, sort_keys=True), color, start_dt.isoformat(), end_dt.isoformat())
+    return read_snapshot(key, load, CALENDAR_SNAPSHOT_TTL)
+
+
+def fetch_events_snapshot(calendars, tzinfo, start_dt, end_dt):
+    sources = list(calendar_sources(calendars))
+    if not sources:
+        return [], None
+    pool = ThreadPoolExecutor(max_workers=len(sources))
+    futures = [
+        pool.submit(load_source_snapshot, cal, color, tzinfo, start_dt, end_dt)
+        for cal, color in sources
+    ]
+    done, _ = wait(futures, timeout=CALENDAR_FETCH_DEADLINE)
+    # Slow sources finish in the background and are picked up by the next render.
+    pool.shutdown(wait=False)
+    events = []
+    stale_since = []
+    for (cal, color), future in zip(sources, futures):
+        source_key = (json.dumps(cal, sort_keys=True), color)
+        source_events, updated, stale = None, None, False
+        if future in done:
             try:
-                mtime = os.path.getmtime(path)
-                cache_key = f"file:{path}"
-                cached = _CAL_CACHE.get(cache_key)
-                if cached and cached.get("mtime") == mtime:
-                    ical_text = cached["data"]
-                else:
-                    with open(path, "rb") as handle:
-                        ical_text = handle.read().decode("utf-8", errors="ignore")
-                    _CAL_CACHE[cache_key] = {"ts": time_mod.time(), "data": ical_text, "mtime": mtime}
-                events.extend(parse_ical_events(ical_text, tzinfo, start_dt, end_dt, cal_name=cal_name, color=color))
+                source_events, updated, stale = future.result()
             except Exception:
-                continue
-        elif cal_type == "google":
-            calendar_id = cal.get("calendar_id")
-            api_key = cal.get("api_key")
-            if not calendar_id or not api_key:
-                continue
-            time_min = quote(start_dt.isoformat())
-            time_max = quote(end_dt.isoformat())
-            url = (
-                "https://www.googleapis.com/calendar/v3/calendars/"
-                f"{quote(calendar_id)}/events?singleEvents=true&orderBy=startTime"
-                f"&timeMin={time_min}&timeMax={time_max}&key={quote(api_key)}"
-            )
-            payload = fetch_json(url, cache_ttl=300)
-            if not payload:
-                continue
-            items = payload.get("items", []) if isinstance(payload, dict) else []
-            events.extend(parse_google_events(items, tzinfo, cal_name=cal_name, color=color))
+                source_events = None
+        if source_events is not None:
+            _LAST_GOOD_EVENTS[source_key] = (source_events, updated or time_mod.time())
+        else:
+            last_good = _LAST_GOOD_EVENTS.get(source_key)
+            if last_good:
+                source_events = events_in_window(last_good[0], tzinfo, start_dt, end_dt)
+                updated, stale = last_good[1], True
+            else:
+                # A fresh process (cron) has no in-memory copy; an older stored
+                # window beats an empty calendar.
+                stored = read_stored_snapshot(
+                    event_store_key(cal, color, tzinfo), start_dt, end_dt, max_age=EVENT_STORE_MAX_AGE_SECONDS
+                )
+                if stored:
+                    source_events, updated = stored
+                    stale = True
+        events.extend(source_events or [])
+        if stale:
+            stale_since.append(updated)
+    return events, min(stale_since) if stale_since else None
+
+
+def fetch_events(calendars, tzinfo, start_dt, end_dt):
+    events, _ = fetch_events_snapshot(calendars, tzinfo, start_dt, end_dt)
     return events
 
 
 def group_events_by_day(events, tzinfo):
-    grouped = {}
-    for event in events:
-        start = event.get("start")
-        if isinstance(start, datetime):
-            day = start.astimezone(tzinfo).date() if tzinfo else start.date()
-        else:
-            day = start
-        grouped.setdefault(day, []).append(event)
-    for day in grouped:
-        grouped[day].sort(key=lambda e: (not e.get("all_day"), e.get("start")))
-    return grouped
+    return EventDayIndex(events, tzinfo)
+
+
+def calendar_weather(ctx):
+    data = ctx.get("data") or {}
+    return data.get("weather") or get_weather_snapshot()
 
 
 def format_time(dt):
@@ -332,7 +926,7 @@ def draw_month_view(ctx, bbox, events_by_day, tzinfo, config):
 
     today = datetime.now(tzinfo).date() if tzinfo else datetime.now().date()
     month_start = today.replace(day=1)
-    weather = get_berlin_weather()
+    weather = calendar_weather(ctx)
     location = (config.get("location") or "Berlin").strip()
     date_text = today.strftime("%d %b").upper()
     min_temp = weather.get("min_temp") if weather else None
@@ -393,9 +987,9 @@ def draw_month_view(ctx, bbox, events_by_day, tzinfo, config):
             card_h = line_height(draw, font_meta) + 2
             start_y = cell_y + 14
             for event in events[:max_events]:
-                title = event.get("title", "")
-                if config.get("show_calendar") and event.get("calendar"):
-                    title = f"{event.get('calendar')}: {title}"
+                title = event.title
+                if config.get("show_calendar") and event.calendar:
+                    title = f"{event.calendar}: {title}"
                 draw_event_card(
                     draw,
                     cell_x + 2,
@@ -403,7 +997,7 @@ def draw_month_view(ctx, bbox, events_by_day, tzinfo, config):
                     cell_w - 4,
                     card_h,
                     title,
-                    event.get("color"),
+                    event.color,
                     inky,
                     font_meta,
                 )
@@ -418,8 +1012,8 @@ def draw_month_view(ctx, bbox, events_by_day, tzinfo, config):
 
 
 def event_time_bounds(event, tzinfo, start_hour, end_hour):
-    start = event.get("start")
-    end = event.get("end") or start
+    start = event.start
+    end = event.end or start
     if not isinstance(start, datetime):
         return None
     start_local = start.astimezone(tzinfo) if tzinfo else start
@@ -450,32 +1044,48 @@ def assign_lanes(events, tzinfo, start_hour, end_hour):
         })
     blocks.sort(key=lambda b: (b["day"], b["start"]))
     result = []
-    for day in sorted({b["day"] for b in blocks}):
-        day_blocks = [b for b in blocks if b["day"] == day]
-        lanes = []
+    for _, day_iter in groupby(blocks, key=lambda b: b["day"]):
+        day_blocks = list(day_iter)
+        # Greedy lanes: each block takes the lowest lane whose last block has ended.
+        active = []
+        free = []
+        lane_count = 0
         for block in day_blocks:
-            placed = False
-            for lane_idx, lane_end in enumerate(lanes):
-                if lane_end <= block["start"]:
-                    lanes[lane_idx] = block["end"]
-                    block["lane"] = lane_idx
-                    placed = True
-                    break
-            if not placed:
-                block["lane"] = len(lanes)
-                lanes.append(block["end"])
-            block["lanes"] = len(lanes)
+            while active and active[0][0] <= block["start"]:
+                heapq.heappush(free, heapq.heappop(active)[1])
+            if free:
+                lane = heapq.heappop(free)
+            else:
+                lane = lane_count
+                lane_count += 1
+            heapq.heappush(active, (block["end"], lane))
+            block["lane"] = lane
             result.append(block)
 
+        # Concurrency per elementary interval between distinct start/end times,
+        # then a sparse table answers "max concurrency over a block" in O(1).
         times = sorted({b["start"] for b in day_blocks} | {b["end"] for b in day_blocks})
+        index = {value: idx for idx, value in enumerate(times)}
+        delta = [0] * len(times)
+        for block in day_blocks:
+            if block["start"] < block["end"]:
+                delta[index[block["start"]]] += 1
+                delta[index[block["end"]]] -= 1
+        overlap = list(accumulate(delta))[:-1] or [0]
+        table = [overlap]
+        width = 1
+        while width * 2 <= len(overlap):
+            prev = table[-1]
+            table.append([max(prev[idx], prev[idx + width]) for idx in range(len(overlap) - width * 2 + 1)])
+            width *= 2
         for block in day_blocks:
+            lo = index[block["start"]]
+            hi = index[block["end"]]
             max_overlap = 1
-            for idx in range(len(times) - 1):
-                mid = (times[idx] + times[idx + 1]) / 2.0
-                if not (block["start"] <= mid < block["end"]):
-                    continue
-                active = sum(1 for b in day_blocks if b["start"] <= mid < b["end"])
-                max_overlap = max(max_overlap, active)
+            if lo < hi:
+                level = (hi - lo).bit_length() - 1
+                row = table[level]
+                max_overlap = max(1, row[lo], row[hi - (1 << level)])
             block["lanes"] = max_overlap
             if block["lanes"] == 1:
                 block["lane"] = 0
@@ -485,25 +1095,40 @@ def assign_lanes(events, tzinfo, start_hour, end_hour):
 
 
 def draw_dither_line(draw, x0, y0, x1, y1, color, step=2):
+    # One draw.point call per primitive; the coordinate list is built in Python.
     if x0 == x1:
         y_start = min(y0, y1)
         y_end = max(y0, y1)
-        for y in range(y_start, y_end + 1, step):
-            draw.point((x0, y), fill=color)
+        draw.point([(x0, y) for y in range(y_start, y_end + 1, step)], fill=color)
         return
     if y0 == y1:
         x_start = min(x0, x1)
         x_end = max(x0, x1)
-        for x in range(x_start, x_end + 1, step):
-            draw.point((x, y0), fill=color)
+        draw.point([(x, y0) for x in range(x_start, x_end + 1, step)], fill=color)
         return
     draw.line((x0, y0, x1, y1), fill=color)
 
 
+@lru_cache(maxsize=32)
+def dither_rect_mask(width, height, step, phase):
+    # Every step-th row gets a dot every 2 * step pixels, shifted by one on alternate rows.
+    period = step * 2
+    blank = bytes(width)
+    rows = [
+        (b"\xff" + bytes(period - 1)) * (width // period + 1),
+        (b"\x00\xff" + bytes(period - 2)) * (width // period + 1),
+    ]
+    data = b"".join(
+        rows[(phase + y // step) % 2][:width] if y % step == 0 else blank for y in range(height)
+    )
+    return Image.frombytes("L", (width, height), data)
+
+
 def draw_dither_rect(draw, x0, y0, x1, y1, color, step=2):
-    for y in range(y0, y1 + 1, step):
-        for x in range(x0 + (y // step) % 2, x1 + 1, step * 2):
-            draw.point((x, y), fill=color)
+    if x1 < x0 or y1 < y0:
+        return
+    mask = dither_rect_mask(x1 - x0 + 1, y1 - y0 + 1, step, (y0 // step) % 2)
+    draw.bitmap((x0, y0), mask, fill=color)
 
 
 def draw_day_view(ctx, bbox, events_by_day, tzinfo, config):
@@ -520,7 +1145,7 @@ def draw_day_view(ctx, bbox, events_by_day, tzinfo, config):
     height = y1 - y0 - (pad * 2)
 
     today = datetime.now(tzinfo).date() if tzinfo else datetime.now().date()
-    weather = get_berlin_weather()
+    weather = calendar_weather(ctx)
     location = (config.get("location") or "Berlin").strip()
     date_text = today.strftime("%d %b").upper()
     min_temp = weather.get("min_temp") if weather else None
@@ -569,11 +1194,11 @@ def draw_day_view(ctx, bbox, events_by_day, tzinfo, config):
             grid_bottom,
             inky.RED,
         )
-    all_day = [e for e in events if e.get("all_day")]
+    all_day = [e for e in events if e.all_day]
     if all_day:
-        title = all_day[0].get("title", "")
-        if config.get("show_calendar") and all_day[0].get("calendar"):
-            title = f"{all_day[0].get('calendar')}: {title}"
+        title = all_day[0].title
+        if config.get("show_calendar") and all_day[0].calendar:
+            title = f"{all_day[0].calendar}: {title}"
         draw_event_card(
             draw,
             day_x + 2,
@@ -581,7 +1206,7 @@ def draw_day_view(ctx, bbox, events_by_day, tzinfo, config):
             day_w - 4,
             all_day_h - 2,
             title,
-            all_day[0].get("color"),
+            all_day[0].color,
             inky,
             font_meta,
         )
@@ -592,7 +1217,7 @@ def draw_day_view(ctx, bbox, events_by_day, tzinfo, config):
         draw.text((x0 + pad, y_line - 6), label, inky.BLACK, font=font_meta)
         draw_dither_line(draw, day_x, y_line, x1 - pad, y_line, inky.BLACK)
 
-    timed = [e for e in events if not e.get("all_day")]
+    timed = [e for e in events if not e.all_day]
     blocks = assign_lanes(timed, tzinfo, start_hour, end_hour)
     for block in blocks:
         if block["day"] != today:
@@ -606,9 +1231,9 @@ def draw_day_view(ctx, bbox, events_by_day, tzinfo, config):
         y = grid_top + (start_float - start_hour) * hour_h
         h = max(1, (end_float - start_float) * hour_h)
         event = block["event"]
-        title = event.get("title", "")
-        if config.get("show_calendar") and event.get("calendar"):
-            title = f"{event.get('calendar')}: {title}"
+        title = event.title
+        if config.get("show_calendar") and event.calendar:
+            title = f"{event.calendar}: {title}"
         row_text = truncate_text(draw, title, lane_w - 4, font=font_body)
         draw_event_card(
             draw,
@@ -617,7 +1242,7 @@ def draw_day_view(ctx, bbox, events_by_day, tzinfo, config):
             lane_w - 2,
             max(line_height(draw, font_body) + 2, int(h) - 2),
             row_text,
-            event.get("color"),
+            event.color,
             inky,
             font_body,
         )
@@ -645,7 +1270,7 @@ def draw_week_view(ctx, bbox, events_by_day, tzinfo, config):
     except (TypeError, ValueError):
         days_in_week = 7
     days_in_week = max(3, min(7, days_in_week))
-    weather = get_berlin_weather()
+    weather = calendar_weather(ctx)
     location = (config.get("location") or "Berlin").strip()
     date_text = today.strftime("%d %b").upper()
     min_temp = weather.get("min_temp") if weather else None
@@ -685,7 +1310,7 @@ def draw_week_view(ctx, bbox, events_by_day, tzinfo, config):
     time_col_w = text_size(draw, f"{end_hour:02d}:00", font_meta)[0] + 6
     day_area_w = max(1, width - time_col_w)
     col_w = max(1, day_area_w // days_in_week)
-    weather = get_berlin_weather()
+    weather = calendar_weather(ctx)
     daily = weather.get("daily") if weather else []
     daily_map = {}
     if daily:
@@ -738,11 +1363,11 @@ def draw_week_view(ctx, bbox, events_by_day, tzinfo, config):
             draw_dither_line(draw, col_x, grid_top, col_x, grid_bottom, inky.BLACK)
 
         events = events_by_day.get(day, [])
-        all_day = [e for e in events if e.get("all_day")]
+        all_day = [e for e in events if e.all_day]
         if all_day:
-            title = all_day[0].get("title", "")
-            if config.get("show_calendar") and all_day[0].get("calendar"):
-                title = f"{all_day[0].get('calendar')}: {title}"
+            title = all_day[0].title
+            if config.get("show_calendar") and all_day[0].calendar:
+                title = f"{all_day[0].calendar}: {title}"
             draw_event_card(
                 draw,
                 col_x + 1,
@@ -750,7 +1375,7 @@ def draw_week_view(ctx, bbox, events_by_day, tzinfo, config):
                 col_w - 2,
                 all_day_h - 2,
                 title,
-                all_day[0].get("color"),
+                all_day[0].color,
                 inky,
                 font_meta,
             )
@@ -761,7 +1386,7 @@ def draw_week_view(ctx, bbox, events_by_day, tzinfo, config):
         draw.text((x0 + pad, y_line - 6), label, inky.BLACK, font=font_meta)
         draw_dither_line(draw, x0 + pad + time_col_w, y_line, x1 - pad, y_line, inky.BLACK)
 
-    timed_events = [e for day in events_by_day.values() for e in day if not e.get("all_day")]
+    timed_events = events_by_day.timed_events()
     blocks = assign_lanes(timed_events, tzinfo, start_hour, end_hour)
     for block in blocks:
         day = block["day"]
@@ -778,9 +1403,9 @@ def draw_week_view(ctx, bbox, events_by_day, tzinfo, config):
         y = grid_top + (start_float - start_hour) * hour_h
         h = max(1, (end_float - start_float) * hour_h)
         event = block["event"]
-        title = event.get("title", "")
-        if config.get("show_calendar") and event.get("calendar"):
-            title = f"{event.get('calendar')}: {title}"
+        title = event.title
+        if config.get("show_calendar") and event.calendar:
+            title = f"{event.calendar}: {title}"
         row_text = truncate_text(draw, title, lane_w - 4, font=font_body)
         draw_event_card(
             draw,
@@ -789,14 +1414,13 @@ def draw_week_view(ctx, bbox, events_by_day, tzinfo, config):
             lane_w - 2,
             max(line_height(draw, font_body) + 2, int(h) - 2),
             row_text,
-            event.get("color"),
+            event.color,
             inky,
             font_body,
         )
 
 
-def draw_calendar_tile(ctx, bbox, config):
-    ensure_fullscreen(ctx, bbox)
+def calendar_window(config):
     tzinfo = get_timezone(config.get("tz"))
     view = str(config.get("view") or "week").lower()
     now = datetime.now(tzinfo) if tzinfo else datetime.now()
@@ -811,48 +1435,56 @@ def draw_calendar_tile(ctx, bbox, config):
     else:
         start_dt = datetime.combine(now.date(), time.min, tzinfo)
         end_dt = start_dt + timedelta(days=7)
+    return tzinfo, view, start_dt, end_dt
 
+
+def fetch_calendar_tile(config):
+    tzinfo, _, start_dt, end_dt = calendar_window(config)
+    calendars = config.get("calendars") or []
+    events, stale_since = fetch_events_snapshot(calendars, tzinfo, start_dt, end_dt)
+    return {
+        "events": events,
+        "stale_since": stale_since,
+        "weather": get_weather_snapshot(),
+    }
+
+
+def draw_calendar_tile(ctx, bbox, config):
+    ensure_fullscreen(ctx, bbox)
+    tzinfo, view, start_dt, end_dt = calendar_window(config)
+
+    stale_since = None
     if ctx.get("preview_stub"):
         start_base = start_dt + timedelta(hours=8)
         events = [
-            {
-                "title": "Design review",
-                "start": start_base,
-                "end": start_base + timedelta(hours=1),
-                "calendar": "Work",
-                "color": "blue",
-                "all_day": False,
-            },
-            {
-                "title": "Focus time",
-                "start": start_base + timedelta(hours=3),
-                "end": start_base + timedelta(hours=5),
-                "calendar": "Work",
-                "color": "orange",
-                "all_day": False,
-            },
-            {
-                "title": "Gym",
-                "start": start_base + timedelta(days=1, hours=1),
-                "end": start_base + timedelta(days=1, hours=2),
-                "calendar": "Personal",
-                "color": "red",
-                "all_day": False,
-            },
-            {
-                "title": "All day event",
-                "start": start_dt.date(),
-                "end": start_dt.date(),
-                "calendar": "Personal",
-                "color": "yellow",
-                "all_day": True,
-            },
+            CalendarEvent(start_base, start_base + timedelta(hours=1), "Design review", "Work", False, "blue"),
+            CalendarEvent(
+                start_base + timedelta(hours=3),
+                start_base + timedelta(hours=5),
+                "Focus time",
+                "Work",
+                False,
+                "orange",
+            ),
+            CalendarEvent(
+                start_base + timedelta(days=1, hours=1),
+                start_base + timedelta(days=1, hours=2),
+                "Gym",
+                "Personal",
+                False,
+                "red",
+            ),
+            CalendarEvent(start_dt.date(), start_dt.date(), "All day event", "Personal", True, "yellow"),
         ]
     else:
         calendars = config.get("calendars") or []
         if not calendars:
             raise ValueError("No calendars configured")
-        events = fetch_events(calendars, tzinfo, start_dt, end_dt)
+        data = ctx.get("data") or {}
+        if "events" in data:
+            events, stale_since = data["events"], data.get("stale_since")
+        else:
+            events, stale_since = fetch_events_snapshot(calendars, tzinfo, start_dt, end_dt)
     events_by_day = group_events_by_day(events, tzinfo)
 
     if view == "month":
@@ -861,3 +1493,5 @@ def draw_calendar_tile(ctx, bbox, config):
         draw_day_view(ctx, bbox, events_by_day, tzinfo, config)
     else:
         draw_week_view(ctx, bbox, events_by_day, tzinfo, config)
+    if stale_since:
+        draw_stale_marker(ctx["draw"], bbox, stale_since, ctx["fonts"]["meta"], ctx["inky"])
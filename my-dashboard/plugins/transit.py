@@ -1,10 +1,38 @@
+import sqlite3
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+from itertools import islice
 from urllib.parse import quote
 
-from utils import fetch_json, text_size, truncate_text
-
-_LAST_DEPARTURES = {}
+from gtfs_index import find_stop, scheduled_departures
+from snapshots import read_snapshot
+from utils import CACHE_DIR, draw_stale_marker, fetch_json, iter_json_array, text_size, truncate_text
+
+# Default for fetch_interval_minutes; between fetches each render recomputes the
+# visible rows from the cached departure times.
+DEPARTURES_SNAPSHOT_TTL = 120
+# Ask BVG only for the departures the tile can show: two direction groups plus
+# slack for extra directions, and a time window that scales with the row count.
+ROWS_FETCHED_PER_GROUP = 4
+DEPARTURE_MINUTES_PER_ROW = 15
+MAX_DEPARTURE_MINUTES = 1440
+# Trip lookups run in parallel; rows whose trip is still loading at the deadline
+# are grouped by their display direction instead.
+TRIP_FETCH_WORKERS = 4
+TRIP_FETCH_DEADLINE = 6
+TRANSIT_DB_PATH = CACHE_DIR / "transit.sqlite3"
+# Stop IDs practically never change; re-resolve old entries in the background.
+STOP_INDEX_REFRESH_SECONDS = 7 * 24 * 3600
+# Learned next stops older than this are looked up again via /trips.
+NEXT_STOP_MAX_AGE_SECONDS = 30 * 24 * 3600
+# Confirmed entries get their seen_at bumped at most this often.
+NEXT_STOP_CONFIRM_SECONDS = 24 * 3600
+
+_TRANSIT_DB = None
+_TRANSIT_DB_LOCK = threading.Lock()
+_STOP_REFRESHING = set()
 
 DEFAULT_TRANSIT_CONFIG = {
     "stops": ["Genslerstr", "Werneuchener Str"],
@@ -13,6 +41,7 @@ DEFAULT_TRANSIT_CONFIG = {
     "line_text_color": "white",
     "line_badge_y_offset": 0,
     "max_rows_per_group": 4,
+    "fetch_interval_minutes": 2,
     "pad": 12,
 }
 
@@ -23,6 +52,7 @@ TRANSIT_SCHEMA = {
     "line_text_color": {"type": "enum", "label": "Line Text", "options": ["white", "black"]},
     "line_badge_y_offset": {"type": "number", "label": "Line Badge Y Offset", "min": -10, "max": 10},
     "max_rows_per_group": {"type": "number", "label": "Max Rows Per Direction", "min": 1, "max": 12},
+    "fetch_interval_minutes": {"type": "number", "label": "Fetch Every (min)", "min": 1, "max": 30},
     "pad": {"type": "number", "label": "Padding", "min": 0, "max": 30},
 }
 
@@ -50,34 +80,204 @@ def normalize_rows(rows):
     return normalized
 
 
-def get_tram_departures(stop_query, line_filter=None):
+def _transit_db():
+    global _TRANSIT_DB
+    if _TRANSIT_DB is None:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(TRANSIT_DB_PATH), timeout=5, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS stop_index ("
+            "query TEXT PRIMARY KEY, stop_id TEXT, stop_name TEXT, resolved_at REAL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS next_stop ("
+            "stop_id TEXT, line TEXT, direction TEXT, next_stop TEXT, seen_at REAL, "
+            "PRIMARY KEY (stop_id, line, direction))"
+        )
+        conn.commit()
+        _TRANSIT_DB = conn
+    return _TRANSIT_DB
+
+
+def _lookup_stop(stop_query):
     stops_url = (
         "https://v6.bvg.transport.rest/stops"
         f"?query={quote(stop_query)}&results=1"
     )
     stops = fetch_json(stops_url, cache_ttl=60)
     if not stops:
-        cached = _LAST_DEPARTURES.get(stop_query)
-        if cached:
-            return cached["stop_name"], normalize_rows(cached["rows"])
-        return stop_query, [("No stop data", None, "", "", "")]
-
+        return None
     stop = stops[0]
     stop_id = stop.get("id")
     stop_name = stop.get("name", stop_query)
     if not stop_id:
-        return stop_name, [("No stop ID", None, "", "", "")]
+        return None, stop_name
     stop_id = stop_id.split(":")[2] if ":" in stop_id else stop_id
+    try:
+        with _TRANSIT_DB_LOCK:
+            conn = _transit_db()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO stop_index (query, stop_id, stop_name, resolved_at) VALUES (?, ?, ?, ?)",
+                    (stop_query, stop_id, stop_name, time.time()),
+                )
+    except (sqlite3.Error, OSError):
+        pass
+    return stop_id, stop_name
+
+
+def _refresh_stop(stop_query):
+    try:
+        _lookup_stop(stop_query)
+    finally:
+        with _TRANSIT_DB_LOCK:
+            _STOP_REFRESHING.discard(stop_query)
+
+
+def resolve_stop(stop_query):
+    try:
+        with _TRANSIT_DB_LOCK:
+            row = _transit_db().execute(
+                "SELECT stop_id, stop_name, resolved_at FROM stop_index WHERE query = ?",
+                (stop_query,),
+            ).fetchone()
+    except (sqlite3.Error, OSError):
+        row = None
+    if not row:
+        return _lookup_stop(stop_query)
+    stop_id, stop_name, resolved_at = row
+    if time.time() - resolved_at >= STOP_INDEX_REFRESH_SECONDS:
+        with _TRANSIT_DB_LOCK:
+            start = stop_query not in _STOP_REFRESHING
+            _STOP_REFRESHING.add(stop_query)
+        if start:
+            threading.Thread(target=_refresh_stop, args=(stop_query,), daemon=True).start()
+    return stop_id, stop_name
+
+
+def rows_per_group(config):
+    max_rows = DEFAULT_TRANSIT_CONFIG["max_rows_per_group"]
+    max_rows_per_group = config.get("max_rows_per_group") or max_rows
+    try:
+        max_rows_per_group = int(max_rows_per_group)
+    except (TypeError, ValueError):
+        max_rows_per_group = max_rows
+    return max(1, min(12, max_rows_per_group))
+
+
+def fetch_interval_seconds(config):
+    minutes = config.get("fetch_interval_minutes")
+    try:
+        minutes = float(minutes)
+    except (TypeError, ValueError):
+        return DEPARTURES_SNAPSHOT_TTL
+    return max(1.0, min(30.0, minutes)) * 60
+
+
+def upcoming_rows(rows, now=None):
+    # Drop vehicles that have already left; placeholder rows without a time stay.
+    now = time.time() if now is None else now
+    upcoming = [row for row in rows if row[1] is None or row[1] >= now]
+    # Everything cached has left (e.g. a long outage without a GTFS index).
+    return upcoming or [("No departures", None, "", "", "")]
+
+
+def departure_row_limit(max_rows_per_group=None):
+    return (max_rows_per_group or DEFAULT_TRANSIT_CONFIG["max_rows_per_group"]) * ROWS_FETCHED_PER_GROUP
+
+
+def learned_next_stops(stop_id):
+    try:
+        with _TRANSIT_DB_LOCK:
+            rows = _transit_db().execute(
+                "SELECT line, direction, next_stop FROM next_stop WHERE stop_id = ? AND seen_at >= ?",
+                (stop_id, time.time() - NEXT_STOP_MAX_AGE_SECONDS),
+            ).fetchall()
+    except (sqlite3.Error, OSError):
+        return {}
+    return {(line, direction): next_stop for line, direction, next_stop in rows}
+
+
+def remember_next_stops(stop_id, next_stops, learned=None):
+    if not next_stops:
+        return
+    learned = learned or {}
+    now = time.time()
+    changed = [
+        (stop_id, line, direction, next_stop, now)
+        for (line, direction), next_stop in next_stops.items()
+        if learned.get((line, direction)) != next_stop
+    ]
+    confirmed = [
+        (now, stop_id, line, direction, now - NEXT_STOP_CONFIRM_SECONDS)
+        for (line, direction), next_stop in next_stops.items()
+        if learned.get((line, direction)) == next_stop
+    ]
+    try:
+        with _TRANSIT_DB_LOCK:
+            conn = _transit_db()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO next_stop (stop_id, line, direction, next_stop, seen_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    changed,
+                )
+                # Keep confirmed entries from expiring without rewriting them every render.
+                conn.executemany(
+                    "UPDATE next_stop SET seen_at = ? "
+                    "WHERE stop_id = ? AND line = ? AND direction = ? AND seen_at < ?",
+                    confirmed,
+                )
+    except (sqlite3.Error, OSError):
+        pass
+
+
+def get_scheduled_departures(stop_query, stop_id, line_filter, row_limit):
+    # Timetable fallback from the optional GTFS index (see gtfs_index.py).
+    stop_name = stop_query
+    if not stop_id:
+        stop = find_stop(stop_query)
+        if not stop:
+            return None
+        stop_id, stop_name = stop
+    departures = scheduled_departures(stop_id, row_limit, line_filter)
+    if not departures:
+        return None
+    rows = []
+    for when, line, headsign, next_stop in departures:
+        rows.append((when.strftime("%H:%M"), when.timestamp(), line, next_stop or headsign, headsign))
+    return stop_name, rows
+
+
+def get_tram_departures(stop_query, line_filter=None, max_rows_per_group=None, cache_ttl=DEPARTURES_SNAPSHOT_TTL):
+    row_limit = departure_row_limit(max_rows_per_group)
+    stop = resolve_stop(stop_query)
+    if not stop:
+        scheduled = get_scheduled_departures(stop_query, None, line_filter, row_limit)
+        if scheduled:
+            return scheduled
+        return stop_query, [("No stop data", None, "", "", "")]
+    stop_id, stop_name = stop
+    if not stop_id:
+        return stop_name, [("No stop ID", None, "", "", "")]
 
+    duration = min(MAX_DEPARTURE_MINUTES, row_limit * DEPARTURE_MINUTES_PER_ROW)
     dep_url = (
         f"https://v6.bvg.transport.rest/stops/{stop_id}/departures"
-        "?duration=1440&stopovers=true"
+        f"?duration={duration}&results={row_limit}&stopovers=true"
+    )
+    # Cached on disk for the whole fetch interval, so cron runs inside it reuse
+    # the response; upcoming_rows drops departures that have left since.
+    departures = fetch_json(
+        dep_url,
+        cache_ttl=cache_ttl,
+        parse=lambda body: list(islice(iter_json_array(body, "departures"), row_limit)),
     )
-    departures = fetch_json(dep_url, cache_ttl=60)
     if not departures:
-        cached = _LAST_DEPARTURES.get(stop_query)
-        if cached:
-            return cached["stop_name"], normalize_rows(cached["rows"])
+        scheduled = get_scheduled_departures(stop_name, stop_id, line_filter, row_limit)
+        if scheduled:
+            return scheduled
         label = line_filter or "Tram"
         return stop_name, [(f"No {label} data", None, "", "", "")]
     if isinstance(departures, dict):
@@ -101,39 +301,96 @@ def get_tram_departures(stop_query, line_filter=None):
                 return stopover.get("stop", {}).get("name")
         return None
 
+    selected = []
     for dep in departures:
         line = dep.get("line", {}).get("name", "Tram")
         if line_filter and line != line_filter:
             continue
-        display_direction = dep.get("direction", "")
-        group_direction = display_direction
-        stopovers = dep.get("stopovers") or []
-        trip_id = dep.get("tripId")
-        if not stopovers and trip_id:
-            trip_url = f"https://v6.bvg.transport.rest/trips/{trip_id}?stopovers=true"
-            trip_data = fetch_json(trip_url, cache_ttl=600)
+        selected.append((dep, line))
+        if len(selected) >= row_limit:
+            break
+
+    # One /trips lookup per line/direction pair this stop has not taught us yet.
+    learned = learned_next_stops(stop_id)
+    inline = {(line, dep.get("direction", "")) for dep, line in selected if dep.get("stopovers")}
+    trip_ids = {}
+    for dep, line in selected:
+        key = (line, dep.get("direction", ""))
+        if not dep.get("stopovers") and dep.get("tripId") and key not in learned and key not in inline:
+            trip_ids.setdefault(key, dep.get("tripId"))
+    trip_stopovers = {}
+    if trip_ids:
+        pool = ThreadPoolExecutor(max_workers=min(TRIP_FETCH_WORKERS, len(trip_ids)))
+        futures = {
+            pool.submit(
+                fetch_json,
+                f"https://v6.bvg.transport.rest/trips/{trip_id}?stopovers=true",
+                cache_ttl=600,
+            ): trip_id
+            for trip_id in trip_ids.values()
+        }
+        done, _ = wait(futures, timeout=TRIP_FETCH_DEADLINE)
+        # Late lookups keep running and land in the fetch cache for the next render.
+        pool.shutdown(wait=False)
+        for future in done:
+            trip_data = future.result()
             if isinstance(trip_data, dict):
                 trip = trip_data.get("trip") or {}
-                stopovers = trip.get("stopovers") or []
+                trip_stopovers[futures[future]] = trip.get("stopovers") or []
+
+    next_stops = []
+    observed = {}
+    for dep, line in selected:
+        stopovers = dep.get("stopovers") or trip_stopovers.get(dep.get("tripId")) or []
         next_stop = next_stop_name(stopovers, stop_id)
+        next_stops.append(next_stop)
+        if next_stop:
+            observed.setdefault((line, dep.get("direction", "")), next_stop)
+
+    for (dep, line), next_stop in zip(selected, next_stops):
+        display_direction = dep.get("direction", "")
+        group_direction = display_direction
+        key = (line, display_direction)
+        next_stop = next_stop or observed.get(key) or learned.get(key)
         if next_stop:
             group_direction = next_stop
         when_text, when_sort = parse_departure_time(dep.get("when") or dep.get("plannedWhen"))
         rows.append((when_text, when_sort, line, group_direction, display_direction))
-        if len(rows) >= 16:
-            break
+    remember_next_stops(stop_id, observed, learned)
     if not rows:
         label = line_filter or "Tram"
         rows.append((f"No {label} departures", None, "", "", ""))
-    else:
-        _LAST_DEPARTURES[stop_query] = {
-            "stop_name": stop_name,
-            "rows": rows,
-            "updated": time.time(),
-        }
     return stop_name, rows
 
 
+def has_departures(result):
+    if not result:
+        return False
+    _, rows = result
+    return any(row[1] is not None for row in rows)
+
+
+def get_departures_snapshot(stop_query, max_rows_per_group=None, ttl=DEPARTURES_SNAPSHOT_TTL):
+    # Serve the last good departures immediately while a refresh runs in the background.
+    result, updated, stale = read_snapshot(
+        ("transit", stop_query, max_rows_per_group),
+        lambda: get_tram_departures(stop_query, max_rows_per_group=max_rows_per_group, cache_ttl=ttl),
+        ttl,
+        is_valid=has_departures,
+    )
+    if not result:
+        result = (stop_query, [("No stop data", None, "", "", "")])
+    stop_name, rows = result
+    return stop_name, upcoming_rows(normalize_rows(rows)), stale, updated
+
+
+def fetch_transit_tile(config):
+    stops = config.get("stops", DEFAULT_TRANSIT_CONFIG["stops"])
+    max_rows_per_group = rows_per_group(config)
+    ttl = fetch_interval_seconds(config)
+    return {stop_query: get_departures_snapshot(stop_query, max_rows_per_group, ttl) for stop_query in stops}
+
+
 def draw_tram_table(draw, x, y, width, title, rows, fonts, inky, title_color, line_bg, line_text_color):
     font_title, font_sub, font_body, font_meta = fonts
     title_text = truncate_text(draw, title, width, font=font_body)
@@ -273,7 +530,7 @@ def draw_transit_tile(ctx, bbox, config):
         line_badge_y_offset = int(line_badge_y_offset)
     except (TypeError, ValueError):
         line_badge_y_offset = DEFAULT_TRANSIT_CONFIG["line_badge_y_offset"]
-    max_rows = DEFAULT_TRANSIT_CONFIG["max_rows_per_group"]
+    max_rows_per_group = rows_per_group(config)
     stub_rows = [
         ("12:05", None, "M5", "S+U Hauptbahnhof", "S+U Hauptbahnhof"),
         ("12:12", None, "M5", "S+U Hauptbahnhof", "S+U Hauptbahnhof"),
@@ -283,17 +540,20 @@ def draw_transit_tile(ctx, bbox, config):
         ("12:21", None, "M5", "Zingster Str.", "Zingster Str."),
     ]
 
+    departures = ctx.get("data") or {}
+    stale_since = []
     for stop_query in stops:
         if ctx.get("preview_stub"):
             stop_name, rows = stop_query, stub_rows
         else:
-            stop_name, rows = get_tram_departures(stop_query)
-        max_rows_per_group = config.get("max_rows_per_group") or max_rows
-        try:
-            max_rows_per_group = int(max_rows_per_group)
-        except (TypeError, ValueError):
-            max_rows_per_group = max_rows
-        max_rows_per_group = max(1, min(12, max_rows_per_group))
+            if stop_query in departures:
+                stop_name, rows, stale, updated = departures[stop_query]
+            else:
+                stop_name, rows, stale, updated = get_departures_snapshot(
+                    stop_query, max_rows_per_group, fetch_interval_seconds(config)
+                )
+            if stale:
+                stale_since.append(updated)
 
         groups = []
         group_index = {}
@@ -407,3 +667,6 @@ def draw_transit_tile(ctx, bbox, config):
                 line_badge_y_offset,
             )
         y += 10
+
+    if stale_since:
+        draw_stale_marker(draw, bbox, min(stale_since), font_meta, inky)
@@ -1,11 +1,14 @@
 from datetime import datetime
 from io import BytesIO
 from pathlib import Path
+import threading
+import time
 from urllib.parse import quote
 
 from PIL import Image
 
-from utils import PALETTE_IMAGE, fetch_json, text_size, truncate_text
+from snapshots import read_snapshot
+from utils import PALETTE_IMAGE, draw_stale_marker, fetch_json, text_size, truncate_text
 
 try:
     from cairosvg import svg2png
@@ -52,6 +55,14 @@ ICON_FILES = {
 DEFAULT_LAT = 52.52
 DEFAULT_LON = 13.41
 DEFAULT_TZ = "Europe/Berlin"
+WEATHER_SNAPSHOT_TTL = 600
+FORECAST_TTL = 300
+# Every location the layout shows is fetched in one Open-Meteo request; locations
+# nothing asked for in this long are dropped from the batch.
+WEATHER_LOCATION_IDLE_SECONDS = 3600
+_FORECASTS = {}
+_WEATHER_LOCATIONS = {}
+_FORECAST_LOCK = threading.Lock()
 
 DEFAULT_WEATHER_CONFIG = {
     "lat": DEFAULT_LAT,
@@ -104,16 +115,85 @@ def weather_label(code):
     return mapping.get(code, f"Code {code}")
 
 
-def get_berlin_weather(lat=DEFAULT_LAT, lon=DEFAULT_LON, tz=DEFAULT_TZ):
-    url = (
+def weather_location(config):
+    return (
+        config.get("lat", DEFAULT_LAT),
+        config.get("lon", DEFAULT_LON),
+        config.get("tz", DEFAULT_TZ),
+    )
+
+
+def register_weather_locations(locations):
+    now = time.time()
+    with _FORECAST_LOCK:
+        for location in locations:
+            _WEATHER_LOCATIONS[location] = now
+
+
+def forecast_url(locations):
+    lats = ",".join(str(lat) for lat, _, _ in locations)
+    lons = ",".join(str(lon) for _, lon, _ in locations)
+    timezones = [tz for _, _, tz in locations]
+    if len(set(timezones)) == 1:
+        timezones = timezones[:1]
+    return (
         "https://api.open-meteo.com/v1/forecast"
-        f"?latitude={lat}&longitude={lon}"
+        f"?latitude={lats}&longitude={lons}"
         f"&current=temperature_2m,apparent_temperature,weather_code,windspeed_10m,is_day"
         f"&daily=temperature_2m_max,temperature_2m_min,precipitation_probability_max,weather_code"
         f"&hourly=temperature_2m"
-        f"&timezone={quote(tz)}"
+        f"&timezone={','.join(quote(tz) for tz in timezones)}"
     )
-    data = fetch_json(url, cache_ttl=300)
+
+
+def _fetch_forecasts(locations):
+    data = fetch_json(forecast_url(locations), cache_ttl=FORECAST_TTL)
+    # Open-Meteo answers a single location with an object and several with a list.
+    if isinstance(data, dict) and len(locations) == 1:
+        data = [data]
+    if not isinstance(data, list) or len(data) != len(locations):
+        return None
+    return data
+
+
+def fetch_forecast(lat=DEFAULT_LAT, lon=DEFAULT_LON, tz=DEFAULT_TZ):
+    location = (lat, lon, tz)
+    now = time.time()
+    with _FORECAST_LOCK:
+        _WEATHER_LOCATIONS[location] = now
+        cached = _FORECASTS.get(location)
+        if cached and now < cached[0]:
+            return cached[1]
+        for key, seen in list(_WEATHER_LOCATIONS.items()):
+            if now - seen > WEATHER_LOCATION_IDLE_SECONDS:
+                del _WEATHER_LOCATIONS[key]
+                _FORECASTS.pop(key, None)
+        # Sorted so tiles refreshing at the same time build the same URL and
+        # fetch_json coalesces them into one request.
+        batch = sorted(
+            (
+                key
+                for key in _WEATHER_LOCATIONS
+                if key == location or not (key in _FORECASTS and now < _FORECASTS[key][0])
+            ),
+            key=str,
+        )
+    forecasts = _fetch_forecasts(batch)
+    if forecasts is None and len(batch) > 1:
+        # One bad location should not take the others down with it.
+        batch = [location]
+        forecasts = _fetch_forecasts(batch)
+    if forecasts is None:
+        return None
+    expires_at = now + FORECAST_TTL
+    with _FORECAST_LOCK:
+        for key, forecast in zip(batch, forecasts):
+            _FORECASTS[key] = (expires_at, forecast)
+    return forecasts[batch.index(location)]
+
+
+def get_berlin_weather(lat=DEFAULT_LAT, lon=DEFAULT_LON, tz=DEFAULT_TZ):
+    data = fetch_forecast(lat, lon, tz)
     if not data:
         return {
             "error": "Weather unavailable",
@@ -163,6 +243,18 @@ def get_berlin_weather(lat=DEFAULT_LAT, lon=DEFAULT_LON, tz=DEFAULT_TZ):
     }
 
 
+def get_weather_snapshot(lat=DEFAULT_LAT, lon=DEFAULT_LON, tz=DEFAULT_TZ):
+    weather, updated, stale = read_snapshot(
+        ("weather", lat, lon, tz),
+        lambda: get_berlin_weather(lat=lat, lon=lon, tz=tz),
+        WEATHER_SNAPSHOT_TTL,
+        is_valid=lambda data: bool(data) and not data.get("error"),
+    )
+    if not weather:
+        weather = {"error": "Weather unavailable", "hourly": []}
+    return {**weather, "stale": stale, "snapshot_at": updated}
+
+
 def get_stub_weather():
     return {
         "error": None,
@@ -186,6 +278,19 @@ def get_stub_weather():
     }
 
 
+def fetch_weather_tile(config):
+    lat, lon, tz = weather_location(config)
+    return get_weather_snapshot(lat=lat, lon=lon, tz=tz)
+
+
+def tile_weather(ctx, config):
+    if ctx.get("preview_stub"):
+        return get_stub_weather()
+    if ctx.get("data") is not None:
+        return ctx["data"]
+    return fetch_weather_tile(config)
+
+
 def weather_icon_key(code, is_day=None):
     is_day = True if is_day is None else bool(is_day)
     if code in (0, 1):
@@ -392,7 +497,7 @@ def line_height(draw, font):
         return text_size(draw, "Ag", font)[1]
 
 
-def draw_weather_tile_split(ctx, bbox, config):
+def draw_weather_tile_split(ctx, bbox, config, weather):
     img = ctx["img"]
     draw = ctx["draw"]
     inky = ctx["inky"]
@@ -410,15 +515,6 @@ def draw_weather_tile_split(ctx, bbox, config):
     w_width = x1 - x0 - (pad * 2)
     w_height = y1 - y0 - (pad * 2)
 
-    if ctx.get("preview_stub"):
-        weather = get_stub_weather()
-    else:
-        weather = get_berlin_weather(
-            lat=config.get("lat", DEFAULT_LAT),
-            lon=config.get("lon", DEFAULT_LON),
-            tz=config.get("tz", DEFAULT_TZ),
-        )
-
     left_col_w = max(0, int(w_width * 0.45))
     gutter = 12
     right_x = wx + left_col_w + gutter
@@ -490,7 +586,7 @@ def draw_weather_tile_split(ctx, bbox, config):
     _ = now
 
 
-def draw_weather_tile_card(ctx, bbox, config):
+def draw_weather_tile_card(ctx, bbox, config, weather):
     img = ctx["img"]
     draw = ctx["draw"]
     inky = ctx["inky"]
@@ -508,15 +604,6 @@ def draw_weather_tile_card(ctx, bbox, config):
     w_width = x1 - x0 - (pad * 2)
     w_height = y1 - y0 - (pad * 2)
 
-    if ctx.get("preview_stub"):
-        weather = get_stub_weather()
-    else:
-        weather = get_berlin_weather(
-            lat=config.get("lat", DEFAULT_LAT),
-            lon=config.get("lon", DEFAULT_LON),
-            tz=config.get("tz", DEFAULT_TZ),
-        )
-
     left_w = max(0, int(w_width * 0.38))
     right_w = max(0, int(w_width * 0.26))
     gutter = 10
@@ -674,7 +761,7 @@ def draw_weather_tile_card(ctx, bbox, config):
                         draw.text((temp_x, temp_y), temp_text, inky.BLACK, font=font_meta)
 
 
-def draw_weather_tile_panel(ctx, bbox, config):
+def draw_weather_tile_panel(ctx, bbox, config, weather):
     img = ctx["img"]
     draw = ctx["draw"]
     inky = ctx["inky"]
@@ -692,15 +779,6 @@ def draw_weather_tile_panel(ctx, bbox, config):
     w_width = x1 - x0 - (pad * 2)
     w_height = y1 - y0 - (pad * 2)
 
-    if ctx.get("preview_stub"):
-        weather = get_stub_weather()
-    else:
-        weather = get_berlin_weather(
-            lat=config.get("lat", DEFAULT_LAT),
-            lon=config.get("lon", DEFAULT_LON),
-            tz=config.get("tz", DEFAULT_TZ),
-        )
-
     meta_line_h = line_height(draw, font_meta)
     body_line_h = line_height(draw, font_body)
     top_h = max(34, meta_line_h + meta_line_h + 10)
@@ -780,9 +858,12 @@ def draw_weather_tile_panel(ctx, bbox, config):
 
 def draw_weather_tile(ctx, bbox, config):
     variant = str(config.get("variant") or "split").lower()
+    weather = tile_weather(ctx, config)
     if variant == "card":
-        draw_weather_tile_card(ctx, bbox, config)
+        draw_weather_tile_card(ctx, bbox, config, weather)
     elif variant == "panel":
-        draw_weather_tile_panel(ctx, bbox, config)
+        draw_weather_tile_panel(ctx, bbox, config, weather)
     else:
-        draw_weather_tile_split(ctx, bbox, config)
+        draw_weather_tile_split(ctx, bbox, config, weather)
+    if weather.get("stale"):
+        draw_stale_marker(ctx["draw"], bbox, weather.get("snapshot_at"), ctx["fonts"]["meta"], ctx["inky"])
@@ -0,0 +1,95 @@
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from plugins.calendar import CalendarEvent, assign_lanes, event_time_bounds  # noqa: E402
+
+
+def reference_assign_lanes(events, tzinfo, start_hour, end_hour):
+    # The previous quadratic implementation, kept to check the layout stays identical.
+    blocks = []
+    for event in events:
+        bounds = event_time_bounds(event, tzinfo, start_hour, end_hour)
+        if not bounds:
+            continue
+        day, start_float, end_float = bounds
+        blocks.append({"event": event, "day": day, "start": start_float, "end": end_float})
+    blocks.sort(key=lambda b: (b["day"], b["start"]))
+    result = []
+    for day in sorted({b["day"] for b in blocks}):
+        day_blocks = [b for b in blocks if b["day"] == day]
+        lanes = []
+        for block in day_blocks:
+            placed = False
+            for lane_idx, lane_end in enumerate(lanes):
+                if lane_end <= block["start"]:
+                    lanes[lane_idx] = block["end"]
+                    block["lane"] = lane_idx
+                    placed = True
+                    break
+            if not placed:
+                block["lane"] = len(lanes)
+                lanes.append(block["end"])
+            block["lanes"] = len(lanes)
+            result.append(block)
+        times = sorted({b["start"] for b in day_blocks} | {b["end"] for b in day_blocks})
+        for block in day_blocks:
+            max_overlap = 1
+            for idx in range(len(times) - 1):
+                mid = (times[idx] + times[idx + 1]) / 2.0
+                if not (block["start"] <= mid < block["end"]):
+                    continue
+                active = sum(1 for b in day_blocks if b["start"] <= mid < b["end"])
+                max_overlap = max(max_overlap, active)
+            block["lanes"] = max_overlap
+            if block["lanes"] == 1:
+                block["lane"] = 0
+            elif block["lane"] >= block["lanes"]:
+                block["lane"] = block["lane"] % block["lanes"]
+    return result
+
+
+def make_events(per_day, days=7, seed=1):
+    rng = random.Random(seed)
+    base = datetime(2026, 1, 5)
+    events = []
+    for day in range(days):
+        for _ in range(per_day):
+            start = base + timedelta(days=day, hours=rng.randint(5, 21), minutes=rng.choice([0, 15, 30, 45]))
+            end = start + timedelta(minutes=rng.choice([0, 15, 30, 60, 90, 120, 240]))
+            events.append(CalendarEvent(start, end, "Meeting"))
+    return events
+
+
+def layout(blocks):
+    return [(id(b["event"]), b["day"], b["start"], b["end"], b["lane"], b["lanes"]) for b in blocks]
+
+
+def best_of(func, events, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(events, None, 6, 20)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    print(f"{'events/day':>10} {'sweep ms':>10} {'previous ms':>12}")
+    for per_day in (10, 100, 1000):
+        events = make_events(per_day)
+        if layout(assign_lanes(events, None, 6, 20)) != layout(reference_assign_lanes(events, None, 6, 20)):
+            raise SystemExit(f"layout mismatch at {per_day} events/day")
+        repeat = 5 if per_day < 1000 else 1
+        sweep = best_of(assign_lanes, events, repeat) * 1000
+        previous = best_of(reference_assign_lanes, events, repeat) * 1000
+        print(f"{per_day:>10} {sweep:>10.2f} {previous:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import math
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from my_dashboard import draw_dotted_rounded_rect  # noqa: E402
+from plugins.calendar import draw_dither_line, draw_dither_rect  # noqa: E402
+
+
+# The previous per-pixel implementations, kept to check the output stays identical.
+def reference_dither_line(draw, x0, y0, x1, y1, color, step=2):
+    if x0 == x1:
+        for y in range(min(y0, y1), max(y0, y1) + 1, step):
+            draw.point((x0, y), fill=color)
+        return
+    if y0 == y1:
+        for x in range(min(x0, x1), max(x0, x1) + 1, step):
+            draw.point((x, y0), fill=color)
+        return
+    draw.line((x0, y0, x1, y1), fill=color)
+
+
+def reference_dither_rect(draw, x0, y0, x1, y1, color, step=2):
+    for y in range(y0, y1 + 1, step):
+        for x in range(x0 + (y // step) % 2, x1 + 1, step * 2):
+            draw.point((x, y), fill=color)
+
+
+def reference_dotted_rounded_rect(draw, bbox, radius, dot, gap, color):
+    x0, y0, x1, y1 = bbox
+    step = dot + gap
+    x = x0 + radius
+    while x < x1 - radius:
+        draw.rectangle((x, y0, x + dot, y0 + dot), fill=color)
+        draw.rectangle((x, y1 - dot, x + dot, y1), fill=color)
+        x += step
+    y = y0 + radius
+    while y < y1 - radius:
+        draw.rectangle((x0, y, x0 + dot, y + dot), fill=color)
+        draw.rectangle((x1 - dot, y, x1, y + dot), fill=color)
+        y += step
+    if radius > 0:
+        angle_step = step / radius
+        for corner_x, corner_y, start_deg in [
+            (x0 + radius, y0 + radius, 180),
+            (x1 - radius, y0 + radius, 270),
+            (x1 - radius, y1 - radius, 0),
+            (x0 + radius, y1 - radius, 90),
+        ]:
+            start_rad = math.radians(start_deg)
+            end_rad = start_rad + (math.pi / 2)
+            angle = start_rad
+            while angle < end_rad:
+                cx = int(corner_x + math.cos(angle) * radius)
+                cy = int(corner_y + math.sin(angle) * radius)
+                draw.rectangle((cx, cy, cx + dot, cy + dot), fill=color)
+                angle += angle_step
+
+
+SIZE = (800, 480)
+
+
+def week_grid(line, rect):
+    # Roughly what draw_week_view does: shaded weekend columns plus hour and day lines.
+    def render(draw):
+        for col in (5, 6):
+            rect(draw, 60 + col * 105, 40, 60 + (col + 1) * 105, 470, 2)
+        for hour in range(15):
+            line(draw, 60, 40 + hour * 28, 795, 40 + hour * 28, 1)
+        for col in range(8):
+            line(draw, 60 + col * 105, 40, 60 + col * 105, 470, 1)
+    return render
+
+
+def dotted_border(func):
+    def render(draw):
+        for dot in (1, 2, 4):
+            func(draw, (2, 2, SIZE[0] - 3, SIZE[1] - 3), 12, dot, dot, 255)
+    return render
+
+
+CASES = [
+    ("week grid", week_grid(draw_dither_line, draw_dither_rect), week_grid(reference_dither_line, reference_dither_rect)),
+    ("dotted border", dotted_border(draw_dotted_rounded_rect), dotted_border(reference_dotted_rounded_rect)),
+]
+
+
+def run(render):
+    img = Image.new("L", SIZE, 0)
+    render(ImageDraw.Draw(img))
+    return img
+
+
+def best_of(render, repeat=20):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        run(render)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    print(f"{'case':>14} {'batched ms':>11} {'previous ms':>12}")
+    for name, batched, reference in CASES:
+        if ImageChops.difference(run(batched), run(reference)).getbbox():
+            raise SystemExit(f"pixel mismatch in {name}")
+        print(f"{name:>14} {best_of(batched) * 1000:>11.2f} {best_of(reference) * 1000:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import json
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import plugins.calendar as calendar  # noqa: E402
+
+BERLIN = ZoneInfo("Europe/Berlin")
+START = datetime(2026, 10, 12, tzinfo=BERLIN)
+END = START + timedelta(days=7)
+
+
+def timed(event_id, summary, day, hour):
+    return {
+        "id": event_id,
+        "status": "confirmed",
+        "summary": summary,
+        "start": {"dateTime": f"2026-10-{day:02d}T{hour:02d}:00:00+02:00"},
+        "end": {"dateTime": f"2026-10-{day:02d}T{hour + 1:02d}:00:00+02:00"},
+    }
+
+
+class FakeGoogle:
+    # Stands in for the events.list endpoint: pages by maxResults, hands out a
+    # new sync token at the end of each listing and replays queued changes.
+    def __init__(self):
+        self.events = {
+            "standup": timed("standup", "Standup", 12, 9),
+            "dentist": timed("dentist", "Dentist", 13, 14),
+            "review": timed("review", "Review", 15, 11),
+            "holiday": {
+                "id": "holiday",
+                "status": "confirmed",
+                "summary": "Holiday",
+                "start": {"date": "2026-10-16"},
+                "end": {"date": "2026-10-17"},
+            },
+        }
+        self.changes = []
+        self.token_gone = False
+        self.tokens = 0
+        self.requests = []
+
+    def respond(self, query):
+        self.requests.append(query)
+        if "syncToken" in query:
+            if self.token_gone:
+                return 410, {"error": {"code": 410, "message": "Sync token is no longer valid"}}
+            items, next_page = self.changes, None
+            self.changes = []
+        else:
+            listing = sorted(self.events.values(), key=lambda item: item["id"])
+            offset = int(query.get("pageToken", 0))
+            size = int(query["maxResults"])
+            items = listing[offset:offset + size]
+            next_page = str(offset + size) if offset + size < len(listing) else None
+        body = {"items": items}
+        if next_page:
+            body["nextPageToken"] = next_page
+        else:
+            self.tokens += 1
+            body["nextSyncToken"] = f"token-{self.tokens}"
+        return 200, body
+
+
+def serve(google):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+            status, body = google.respond(query)
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def titles():
+    events = calendar.google_calendar_events("home@example.com", "KEY", BERLIN, START, END, "Home", "blue")
+    return [(event.start.strftime("%m-%d %H:%M"), event.title) for event in events]
+
+
+def expect(label, actual, expected):
+    if actual != expected:
+        raise SystemExit(f"{label}: expected {expected!r}, got {actual!r}")
+    print(f"ok  {label}")
+
+
+def main():
+    google = FakeGoogle()
+    server = serve(google)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Point the API and the mirror at the stand-in server and a scratch database.
+        calendar.GOOGLE_CALENDAR_API = f"http://127.0.0.1:{server.server_port}/calendar/v3"
+        calendar.GOOGLE_PAGE_SIZE = 3
+        calendar.CALENDAR_CACHE_PATH = Path(tmp) / "calendar_cache.sqlite3"
+        calendar.ICAL_CACHE_DIR = Path(tmp) / "ical"
+        calendar._CALENDAR_DB = None
+        full_listing = [
+            ("10-12 09:00", "Standup"),
+            ("10-13 14:00", "Dentist"),
+            ("10-15 11:00", "Review"),
+            ("10-16 00:00", "Holiday"),
+        ]
+
+        expect("full listing follows nextPageToken", titles(), full_listing)
+        expect("pages requested", [query.get("pageToken") for query in google.requests], [None, "3"])
+        expect("fields= sent", {query.get("fields") for query in google.requests}, {calendar.GOOGLE_EVENT_FIELDS})
+
+        google.requests.clear()
+        google.changes = [
+            {"id": "dentist", "status": "cancelled"},
+            {**google.events["review"], "summary": "Design review"},
+        ]
+        expect(
+            "incremental sync applies cancellations as deletes",
+            titles(),
+            [("10-12 09:00", "Standup"), ("10-15 11:00", "Design review"), ("10-16 00:00", "Holiday")],
+        )
+        expect("incremental sync uses the token", [query.get("syncToken") for query in google.requests], ["token-1"])
+        expect("fields= sent on incremental sync", google.requests[0].get("fields"), calendar.GOOGLE_EVENT_FIELDS)
+
+        google.requests.clear()
+        google.token_gone = True
+        expect("410 resyncs from the server copy", titles(), full_listing)
+        expect(
+            "410 falls back to a full listing",
+            [("syncToken" in query, "timeMin" in query) for query in google.requests],
+            [(True, False), (False, True), (False, True)],
+        )
+        calendar._CALENDAR_DB.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
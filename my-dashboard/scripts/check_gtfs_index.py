@@ -0,0 +1,63 @@
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import gtfs_index  # noqa: E402
+
+FIXTURE = Path(__file__).resolve().parent / "fixtures" / "gtfs"
+BERLIN = ZoneInfo("Europe/Berlin")
+GENSLER = "900110005"
+
+
+def departures(now, limit=5, line_filter=None):
+    rows = gtfs_index.scheduled_departures(GENSLER, limit, line_filter=line_filter, now=now)
+    return [(when.strftime("%Y-%m-%d %H:%M"), line, next_stop) for when, line, _, next_stop in rows]
+
+
+def expect(label, actual, expected):
+    if actual != expected:
+        raise SystemExit(f"{label}: expected {expected!r}, got {actual!r}")
+    print(f"ok  {label}")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        # Point the lookups at a scratch index built from the fixture feed.
+        gtfs_index.GTFS_INDEX_PATH = Path(tmp) / "gtfs.sqlite3"
+        count = gtfs_index.import_gtfs(FIXTURE, gtfs_index.GTFS_INDEX_PATH, ["Genslerstr"])
+        # A trip ending at the stop is not a departure from it.
+        expect("imported departures", count, 5)
+        expect("find stop", gtfs_index.find_stop("gensler"), (GENSLER, "Genslerstr. (Berlin)"))
+        expect("unwanted stops dropped", gtfs_index.find_stop("Zingster"), None)
+        expect(
+            "morning departures",
+            departures(datetime(2026, 10, 16, 7, 55, tzinfo=BERLIN), limit=3),
+            [
+                ("2026-10-16 08:00", "M5", "Zingster Str. (Berlin)"),
+                ("2026-10-16 08:10", "M6", "S+U Hauptbahnhof (Berlin)"),
+                ("2026-10-16 08:20", "M5", "Zingster Str. (Berlin)"),
+            ],
+        )
+        expect(
+            "line filter",
+            departures(datetime(2026, 10, 16, 7, 55, tzinfo=BERLIN), line_filter="M6"),
+            [("2026-10-16 08:10", "M6", "S+U Hauptbahnhof (Berlin)")],
+        )
+        expect(
+            "after midnight belongs to the previous service day",
+            departures(datetime(2026, 10, 17, 0, 5, tzinfo=BERLIN), limit=1),
+            [("2026-10-17 00:10", "M5", "Zingster Str. (Berlin)")],
+        )
+        expect(
+            "calendar_dates exceptions",
+            departures(datetime(2026, 12, 25, 7, 0, tzinfo=BERLIN)),
+            [("2026-12-25 10:00", "M5", "Zingster Str. (Berlin)")],
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,9 @@ from urllib.parse import parse_qs, urlparse
 from my_dashboard import (
     load_config,
     render_dashboard,
+    refresh_display,
+    run_daemon,
+    next_refresh_time,
     default_config,
     normalize_config,
     CONFIG_VERSION,
@@ -44,6 +47,10 @@ _apply_started_at = None
 _apply_last_error = None
 _apply_last_finished_at = None
 _update_last_error = None
+_daemon_lock = threading.Lock()
+_daemon_thread = None
+_daemon_stop = None
+_daemon_reschedule = None
 
 
 
@@ -58,15 +65,46 @@ def _progress_for_elapsed(elapsed):
     return 85, "Finalizing"
 
 
+def _apply_running(process):
+    if isinstance(process, threading.Thread):
+        return process.is_alive()
+    return process.poll() is None
+
+
+def _start_apply_thread():
+    def run():
+        global _apply_process, _apply_last_error, _apply_last_finished_at
+        error = None
+        try:
+            refresh_display(load_config())
+        except Exception as exc:
+            error = str(exc) or "Upload failed"
+        with _apply_lock:
+            _apply_last_error = error
+            _apply_last_finished_at = time.time()
+            _apply_process = None
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
 def start_apply_process(cfg):
     global _apply_process, _apply_started_at, _apply_last_error, _apply_last_finished_at
     with _apply_lock:
-        if _apply_process and _apply_process.poll() is None:
+        if _apply_process and _apply_running(_apply_process):
             return _apply_process, False
         try:
             CONFIG_PATH.write_text(json.dumps(cfg, indent=2))
         except Exception:
             pass
+        if render_daemon_running():
+            # The resident renderer owns the display; refresh in-process instead of spawning.
+            _apply_started_at = time.time()
+            _apply_last_error = None
+            _apply_last_finished_at = None
+            _apply_process = _start_apply_thread()
+            return _apply_process, True
         env = os.environ.copy()
         env["PYTHONPATH"] = str(BASE_DIR)
         process = subprocess.Popen(
@@ -102,7 +140,7 @@ def get_apply_state():
         error = _apply_last_error
         finished_at = _apply_last_finished_at
 
-    if process and process.poll() is None and started_at:
+    if process and _apply_running(process) and started_at:
         elapsed = time.time() - started_at
         percent, message = _progress_for_elapsed(elapsed)
         return {
@@ -118,7 +156,42 @@ def get_apply_state():
     }
 
 
-def update_cron(schedule=None, minutes=None):
+def render_daemon_running():
+    with _daemon_lock:
+        return bool(_daemon_thread and _daemon_thread.is_alive())
+
+
+def is_daemon_mode(cfg):
+    # Schedules the daemon cannot follow (e.g. @reboot) stay with cron.
+    if str(cfg.get("update_mode") or "cron").lower() != "daemon":
+        return False
+    return next_refresh_time(cfg) is not None
+
+
+def sync_render_daemon(cfg):
+    global _daemon_thread, _daemon_stop, _daemon_reschedule
+    daemon_mode = is_daemon_mode(cfg)
+    with _daemon_lock:
+        running = bool(_daemon_thread and _daemon_thread.is_alive())
+        if daemon_mode and not running:
+            _daemon_stop = threading.Event()
+            _daemon_reschedule = threading.Event()
+            _daemon_thread = threading.Thread(
+                target=run_daemon,
+                args=(_daemon_stop, _daemon_reschedule),
+                daemon=True,
+            )
+            _daemon_thread.start()
+        elif daemon_mode:
+            # Only recompute the wait; a config save must not refresh the panel.
+            _daemon_reschedule.set()
+        elif running:
+            _daemon_stop.set()
+            _daemon_reschedule.set()
+            _daemon_thread = None
+
+
+def update_cron(schedule=None, minutes=None, mode=None):
     schedule = (schedule or "").strip()
     command = f"{sys.executable} {SCRIPT_PATH}"
     try:
@@ -134,6 +207,10 @@ def update_cron(schedule=None, minutes=None):
         return False, f"Failed to read crontab: {exc}"
 
     next_lines = [line for line in lines if command not in line]
+    if str(mode or "cron").lower() == "daemon":
+        # The server hosts the renderer; no cron entry should compete for the display.
+        minutes = None
+        schedule = ""
     if minutes is not None:
         try:
             minutes = int(minutes)
@@ -397,10 +474,12 @@ class DashboardHandler(SimpleHTTPRequestHandler):
                 CONFIG_PATH.write_text(json.dumps(payload, indent=2))
                 minutes = payload.get("update_interval_minutes")
                 schedule = payload.get("update_schedule")
-                if minutes is not None or schedule is not None:
-                    ok, message = update_cron(schedule=schedule, minutes=minutes)
+                mode = "daemon" if is_daemon_mode(payload) else "cron"
+                if minutes is not None or schedule is not None or is_daemon_mode(payload):
+                    ok, message = update_cron(schedule=schedule, minutes=minutes, mode=mode)
                     if not ok:
                         return self._send_json({"error": message}, status=400)
+                sync_render_daemon(payload)
             except Exception:
                 return self._send_json({"error": "Failed to save config"}, status=500)
             return self._send_json({"ok": True})
@@ -470,11 +549,13 @@ class DashboardHandler(SimpleHTTPRequestHandler):
                 preset_cfg = json.loads(preset_path.read_text())
                 minutes = preset_cfg.get("update_interval_minutes")
                 schedule = preset_cfg.get("update_schedule")
-                if minutes is None and schedule is None:
+                mode = "daemon" if is_daemon_mode(preset_cfg) else "cron"
+                if minutes is None and schedule is None and not is_daemon_mode(preset_cfg):
                     return self._send_json({"error": "Preset missing schedule"}, status=400)
-                ok, message = update_cron(schedule=schedule, minutes=minutes)
+                ok, message = update_cron(schedule=schedule, minutes=minutes, mode=mode)
                 if not ok:
                     return self._send_json({"error": message}, status=400)
+                sync_render_daemon(preset_cfg)
             except Exception:
                 return self._send_json({"error": "Failed to update schedule"}, status=500)
             return self._send_json({"ok": True, "name": safe})
@@ -563,8 +644,10 @@ def main():
         cfg = load_config()
         minutes = cfg.get("update_interval_minutes")
         schedule = cfg.get("update_schedule")
-        if minutes is not None or schedule:
-            update_cron(schedule=schedule, minutes=minutes)
+        mode = "daemon" if is_daemon_mode(cfg) else "cron"
+        if minutes is not None or schedule or is_daemon_mode(cfg):
+            update_cron(schedule=schedule, minutes=minutes, mode=mode)
+        sync_render_daemon(cfg)
     except Exception:
         pass
 
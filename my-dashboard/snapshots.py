@@ -0,0 +1,93 @@
+import threading
+import time
+
+# Refresh sources in the background once they reach this fraction of their TTL,
+# so renders find fresh data instead of waiting on upstream.
+REFRESH_AHEAD = 0.8
+REFRESH_POLL_SECONDS = 15
+# Drop sources that no render has asked for in a while.
+MAX_IDLE_SECONDS = 3600
+
+_SNAPSHOTS = {}
+_SNAPSHOT_LOCK = threading.Lock()
+_REFRESHER = None
+
+
+def _refresh(key, force=False):
+    with _SNAPSHOT_LOCK:
+        entry = _SNAPSHOTS.get(key)
+        if not entry or (entry["refreshing"] and not force):
+            return None
+        entry["refreshing"] = True
+        entry["checked"] = time.time()
+        loader = entry["loader"]
+        is_valid = entry["is_valid"]
+    data = None
+    try:
+        data = loader()
+        valid = is_valid(data) if is_valid else data is not None
+    except Exception:
+        valid = False
+    with _SNAPSHOT_LOCK:
+        entry["refreshing"] = False
+        if valid:
+            entry["data"] = data
+            entry["updated"] = time.time()
+    return data
+
+
+def _refresh_async(key):
+    threading.Thread(target=_refresh, args=(key,), daemon=True).start()
+
+
+def _refresher_loop():
+    while True:
+        time.sleep(REFRESH_POLL_SECONDS)
+        now = time.time()
+        with _SNAPSHOT_LOCK:
+            for key in [key for key, entry in _SNAPSHOTS.items() if now - entry["read_at"] >= MAX_IDLE_SECONDS]:
+                if not _SNAPSHOTS[key]["refreshing"]:
+                    del _SNAPSHOTS[key]
+            due = [
+                key
+                for key, entry in _SNAPSHOTS.items()
+                if not entry["refreshing"]
+                and now - entry["checked"] >= entry["ttl"] * REFRESH_AHEAD
+            ]
+        for key in due:
+            _refresh(key)
+
+
+def _ensure_refresher():
+    global _REFRESHER
+    with _SNAPSHOT_LOCK:
+        if _REFRESHER and _REFRESHER.is_alive():
+            return
+        _REFRESHER = threading.Thread(target=_refresher_loop, daemon=True)
+        _REFRESHER.start()
+
+
+def read_snapshot(key, loader, ttl, is_valid=None):
+    now = time.time()
+    with _SNAPSHOT_LOCK:
+        entry = _SNAPSHOTS.get(key)
+        if entry is None:
+            entry = {"data": None, "updated": None, "checked": 0.0, "refreshing": False}
+            _SNAPSHOTS[key] = entry
+        entry.update(loader=loader, ttl=ttl, is_valid=is_valid, read_at=now)
+        updated = entry["updated"]
+    _ensure_refresher()
+    if updated is None:
+        # Nothing usable yet: this is the only case where a render waits on upstream.
+        data = _refresh(key, force=True)
+        with _SNAPSHOT_LOCK:
+            if entry["updated"] is None:
+                return data, None, False
+            return entry["data"], entry["updated"], False
+    with _SNAPSHOT_LOCK:
+        data = entry["data"]
+        updated = entry["updated"]
+    stale = now - updated >= ttl
+    if stale:
+        _refresh_async(key)
+    return data, updated, stale
@@ -1,7 +1,15 @@
+import gzip
+import http.client
 import json
+import sqlite3
+import threading
 import time
+import zlib
 from datetime import datetime
-from urllib.request import Request, urlopen
+from email.message import Message
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlparse
 
 from PIL import Image
 
@@ -22,30 +30,424 @@ _palette.extend([0, 0, 0] * (256 - len(PALETTE_COLORS)))
 PALETTE_IMAGE.putpalette(_palette)
 
 
+def nearest_palette_index(color):
+    r, g, b = color[:3]
+    best_idx = 0
+    best_dist = None
+    for idx, (pr, pg, pb) in enumerate(PALETTE_COLORS):
+        dist = (r - pr) ** 2 + (g - pg) ** 2 + (b - pb) ** 2
+        if best_dist is None or dist < best_dist:
+            best_idx = idx
+            best_dist = dist
+    return best_idx
+
+
+CACHE_DIR = Path(__file__).resolve().parent / ".generated"
+FETCH_CACHE_PATH = CACHE_DIR / "fetch_cache.sqlite3"
+FETCH_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# After this many consecutive failed calls a host is skipped; every
+# CIRCUIT_PROBE_SECONDS one real request is let through to see if it answers.
+# Breaker and negative-cache state live in fetch_cache.sqlite3, so cron runs
+# (a fresh process each time) fail fast when an earlier run saw the host down.
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_PROBE_SECONDS = 60
+NEGATIVE_CACHE_TTL = 30
+# Idle keep-alive connections kept per host; transit alone makes dozens of
+# requests per render against the same API host.
+HTTP_POOL_SIZE = 4
+HTTP_MAX_REDIRECTS = 5
+HTTP_HEADERS = {
+    "User-Agent": "inky-dashboard/1.0",
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+}
+
 _FETCH_CACHE = {}
+# Guards _FETCH_CACHE and _IN_FLIGHT; never held across I/O.
+_FETCH_CACHE_LOCK = threading.Lock()
+_IN_FLIGHT = {}
+_FETCH_DB = None
+_FETCH_DB_LOCK = threading.Lock()
+_HTTP_POOL = {}
+_HTTP_POOL_LOCK = threading.Lock()
 
 
-def fetch_json(url, timeout=10, retries=3, delay=10, cache_ttl=None):
-    if cache_ttl:
+def _fetch_db():
+    global _FETCH_DB
+    if _FETCH_DB is None:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(FETCH_CACHE_PATH), timeout=5, check_same_thread=False)
+        # WAL lets the cron renderer and the server read while the other one writes.
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS fetch_cache ("
+            "url TEXT PRIMARY KEY, expires_at REAL, stored_at REAL, size INTEGER, body TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS host_state ("
+            "host TEXT PRIMARY KEY, failures INTEGER, open_until REAL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS negative_cache (url TEXT PRIMARY KEY, expires_at REAL)")
+        conn.commit()
+        _FETCH_DB = conn
+    return _FETCH_DB
+
+
+def _disk_cache_get(url):
+    try:
+        with _FETCH_DB_LOCK:
+            row = _fetch_db().execute(
+                "SELECT expires_at, body FROM fetch_cache WHERE url = ?",
+                (url,),
+            ).fetchone()
+    except (sqlite3.Error, OSError):
+        return None
+    if not row:
+        return None
+    try:
+        return row[0], json.loads(row[1])
+    except ValueError:
+        return None
+
+
+def _disk_cache_put(url, expires_at, data):
+    body = json.dumps(data, separators=(",", ":"))
+    now = time.time()
+    try:
+        with _FETCH_DB_LOCK:
+            conn = _fetch_db()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO fetch_cache (url, expires_at, stored_at, size, body) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (url, expires_at, now, len(body), body),
+                )
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM fetch_cache").fetchone()[0]
+                if total > FETCH_CACHE_MAX_BYTES:
+                    # Evict expired entries first, then the oldest ones.
+                    rows = conn.execute(
+                        "SELECT url, size FROM fetch_cache ORDER BY expires_at > ? DESC, stored_at DESC",
+                        (now,),
+                    ).fetchall()
+                    kept = 0
+                    stale = []
+                    for row_url, size in rows:
+                        kept += size or 0
+                        if kept > FETCH_CACHE_MAX_BYTES and row_url != url:
+                            stale.append((row_url,))
+                    conn.executemany("DELETE FROM fetch_cache WHERE url = ?", stale)
+    except (sqlite3.Error, OSError):
+        pass
+
+
+def _cache_lookup(url):
+    with _FETCH_CACHE_LOCK:
         cached = _FETCH_CACHE.get(url)
+    if not cached or time.time() >= cached[0]:
+        # Another process (cron renderer or preview server) may have fetched it already.
+        cached = _disk_cache_get(url)
         if cached:
-            expires_at, data = cached
-            if time.time() < expires_at:
-                return data
-    req = Request(url, headers={"User-Agent": "inky-dashboard/1.0"})
+            with _FETCH_CACHE_LOCK:
+                _FETCH_CACHE[url] = cached
+    if cached and time.time() < cached[0]:
+        return cached[1]
+    return None
+
+
+def _checkout_connection(scheme, netloc, timeout):
+    with _HTTP_POOL_LOCK:
+        idle = _HTTP_POOL.get((scheme, netloc))
+        if idle:
+            conn = idle.pop()
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+    return _new_connection(scheme, netloc, timeout), False
+
+
+def _new_connection(scheme, netloc, timeout):
+    conn_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+    return conn_class(netloc, timeout=timeout)
+
+
+def _checkin_connection(scheme, netloc, conn):
+    with _HTTP_POOL_LOCK:
+        idle = _HTTP_POOL.setdefault((scheme, netloc), [])
+        if len(idle) < HTTP_POOL_SIZE:
+            idle.append(conn)
+            return
+    conn.close()
+
+
+def _decode_body(body, encoding):
+    encoding = (encoding or "").lower()
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # Some servers send raw deflate without the zlib header.
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+def _http_request(url, timeout, headers):
+    parts = urlparse(url)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    conn, reused = _checkout_connection(parts.scheme, parts.netloc, timeout)
+    try:
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+    except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+        conn.close()
+        if not reused:
+            raise
+        # The server dropped an idle keep-alive connection; retry on a fresh one.
+        conn = _new_connection(parts.scheme, parts.netloc, timeout)
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        except Exception:
+            conn.close()
+            raise
+    except Exception:
+        conn.close()
+        raise
+    if response.will_close:
+        conn.close()
+    else:
+        _checkin_connection(parts.scheme, parts.netloc, conn)
+    return response, body
+
+
+def http_request(url, timeout=10, headers=None):
+    request_headers = {**HTTP_HEADERS, **(headers or {})}
+    for _ in range(HTTP_MAX_REDIRECTS + 1):
+        response, body = _http_request(url, timeout, request_headers)
+        location = response.getheader("Location")
+        if response.status in (301, 302, 303, 307, 308) and location:
+            url = urljoin(url, location)
+            continue
+        if response.status >= 400:
+            error_headers = Message()
+            for name, value in response.getheaders():
+                error_headers[name] = value
+            raise HTTPError(url, response.status, response.reason, error_headers, None)
+        return response, _decode_body(body, response.getheader("Content-Encoding"))
+    raise HTTPError(url, 310, "Too many redirects", Message(), None)
+
+
+def http_get(url, timeout=10, headers=None):
+    return http_request(url, timeout, headers)[1]
+
+
+def host_available(host):
+    try:
+        with _FETCH_DB_LOCK:
+            row = _fetch_db().execute("SELECT open_until FROM host_state WHERE host = ?", (host,)).fetchone()
+    except (sqlite3.Error, OSError):
+        return True
+    return not (row and row[0] is not None and time.time() < row[0])
+
+
+def _host_gate(host):
+    # "closed", "open", or "probe" when this caller may try the open host once.
+    now = time.time()
+    try:
+        with _FETCH_DB_LOCK:
+            conn = _fetch_db()
+            with conn:
+                row = conn.execute("SELECT open_until FROM host_state WHERE host = ?", (host,)).fetchone()
+                if not row or row[0] is None:
+                    return "closed"
+                if now < row[0]:
+                    return "open"
+                # Only the caller (in any process) that moves open_until on gets to probe.
+                claimed = conn.execute(
+                    "UPDATE host_state SET open_until = ? WHERE host = ? AND open_until = ?",
+                    (now + CIRCUIT_PROBE_SECONDS, host, row[0]),
+                ).rowcount
+    except (sqlite3.Error, OSError):
+        return "closed"
+    return "probe" if claimed else "open"
+
+
+def _host_succeeded(host):
+    try:
+        with _FETCH_DB_LOCK:
+            conn = _fetch_db()
+            # Read first: most successes have nothing to reset and should not write.
+            if conn.execute("SELECT 1 FROM host_state WHERE host = ?", (host,)).fetchone():
+                with conn:
+                    conn.execute("DELETE FROM host_state WHERE host = ?", (host,))
+    except (sqlite3.Error, OSError):
+        pass
+
+
+def _host_failed(host):
+    now = time.time()
+    try:
+        with _FETCH_DB_LOCK:
+            conn = _fetch_db()
+            with conn:
+                conn.execute(
+                    "INSERT INTO host_state (host, failures, open_until) VALUES (?, 1, NULL) "
+                    "ON CONFLICT (host) DO UPDATE SET failures = failures + 1",
+                    (host,),
+                )
+                conn.execute(
+                    "UPDATE host_state SET open_until = ? WHERE host = ? AND failures >= ?",
+                    (now + CIRCUIT_PROBE_SECONDS, host, CIRCUIT_FAILURE_THRESHOLD),
+                )
+    except (sqlite3.Error, OSError):
+        pass
+
+
+def _negative_cached(url):
+    try:
+        with _FETCH_DB_LOCK:
+            row = _fetch_db().execute("SELECT expires_at FROM negative_cache WHERE url = ?", (url,)).fetchone()
+    except (sqlite3.Error, OSError):
+        return False
+    return row is not None and time.time() < row[0]
+
+
+def _remember_failure(url):
+    now = time.time()
+    try:
+        with _FETCH_DB_LOCK:
+            conn = _fetch_db()
+            with conn:
+                conn.execute("DELETE FROM negative_cache WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO negative_cache (url, expires_at) VALUES (?, ?)",
+                    (url, now + NEGATIVE_CACHE_TTL),
+                )
+    except (sqlite3.Error, OSError):
+        pass
+
+
+def _skip_whitespace(text, idx, chars=" \t\r\n"):
+    while idx < len(text) and text[idx] in chars:
+        idx += 1
+    return idx
+
+
+def iter_json_array(body, key=None):
+    # Decode array items one at a time so callers can stop once they have enough.
+    text = body.decode("utf-8") if isinstance(body, bytes) else body
+    decoder = json.JSONDecoder()
+    idx = _skip_whitespace(text, 0)
+    if key is not None and text.startswith("{", idx):
+        idx = _skip_whitespace(text, idx + 1)
+        while not text.startswith("}", idx):
+            name, idx = decoder.raw_decode(text, idx)
+            idx = _skip_whitespace(text, idx)
+            if not text.startswith(":", idx):
+                raise ValueError("Expected ':' in object")
+            idx = _skip_whitespace(text, idx + 1)
+            if name == key:
+                break
+            _, idx = decoder.raw_decode(text, idx)
+            idx = _skip_whitespace(text, idx, " \t\r\n,")
+        else:
+            return
+    if not text.startswith("[", idx):
+        raise ValueError("Expected JSON array")
+    idx = _skip_whitespace(text, idx + 1)
+    while not text.startswith("]", idx):
+        item, idx = decoder.raw_decode(text, idx)
+        yield item
+        idx = _skip_whitespace(text, idx, " \t\r\n,")
+        if idx >= len(text):
+            raise ValueError("Unterminated JSON array")
+
+
+def fetch_json(url, timeout=10, retries=3, delay=10, cache_ttl=None, parse=json.loads):
+    if cache_ttl:
+        data = _cache_lookup(url)
+        if data is not None:
+            return data
+    # Concurrent identical requests share one upstream call (e.g. a weather tile
+    # and the calendar's weather row, or a preview during a scheduled render).
+    # Keyed by URL like the caches: callers pass fresh parse lambdas, and one URL
+    # always gets parsed the same way.
+    key = url
+    with _FETCH_CACHE_LOCK:
+        flight = _IN_FLIGHT.get(key)
+        leader = flight is None
+        if leader:
+            flight = {"done": threading.Event(), "data": None}
+            _IN_FLIGHT[key] = flight
+    if not leader:
+        flight["done"].wait()
+        return flight["data"]
+    try:
+        # The previous leader may have filled the cache just before we registered.
+        data = _cache_lookup(url) if cache_ttl else None
+        if data is None:
+            data = _fetch_json(url, timeout, retries, delay, cache_ttl, parse)
+        flight["data"] = data
+    finally:
+        with _FETCH_CACHE_LOCK:
+            _IN_FLIGHT.pop(key, None)
+        flight["done"].set()
+    return flight["data"]
+
+
+def _fetch_json(url, timeout, retries, delay, cache_ttl, parse):
+    host = urlparse(url).netloc
+    if _negative_cached(url):
+        return None
+    gate = _host_gate(host)
+    if gate == "open":
+        return None
+    if gate == "probe":
+        # A probe gets one attempt; failing it reopens the breaker right away.
+        retries = 1
+    host_error = False
     for attempt in range(retries):
         try:
-            with urlopen(req, timeout=timeout) as response:
-                data = json.load(response)
-                if data in (None, {}, []):
-                    raise ValueError("Empty response")
-                if cache_ttl:
-                    _FETCH_CACHE[url] = (time.time() + cache_ttl, data)
-                return data
+            data = parse(http_get(url, timeout=timeout))
+            _host_succeeded(host)
+            if data in (None, {}, []):
+                raise ValueError("Empty response")
+            if cache_ttl:
+                expires_at = time.time() + cache_ttl
+                with _FETCH_CACHE_LOCK:
+                    _FETCH_CACHE[url] = (expires_at, data)
+                _disk_cache_put(url, expires_at, data)
+            return data
+        except HTTPError as exc:
+            if exc.code < 500:
+                # The host answered; retrying a client error will not help.
+                _host_succeeded(host)
+                host_error = False
+                break
+            host_error = True
+        except ValueError:
+            host_error = False
         except Exception:
-            if attempt == retries - 1:
-                return None
+            host_error = True
+        if not host_available(host):
+            # Another request opened the breaker while this one was retrying.
+            break
+        if attempt < retries - 1:
             time.sleep(delay)
+    if host_error:
+        # One failed call counts once, however many attempts it made.
+        _host_failed(host)
+    _remember_failure(url)
+    return None
+
 
 def text_size(draw, text, font):
     bbox = draw.textbbox((0, 0), text, font=font)
@@ -64,6 +466,17 @@ def truncate_text(draw, text, max_width, font):
     return cut + ellipsis if cut else ""
 
 
+def draw_stale_marker(draw, bbox, updated, font, inky, pad=6):
+    label = f"as of {datetime.fromtimestamp(updated).strftime('%H:%M')}" if updated else "offline"
+    left, top, right, bottom = draw.textbbox((0, 0), label, font=font)
+    _, _, x1, y1 = bbox
+    # Anchor the boxed label to the bottom-right corner, inside the tile border.
+    x = x1 - pad - 2 - right
+    y = y1 - pad - 2 - bottom
+    draw.rectangle((x + left - 2, y + top - 2, x + right + 2, y + bottom + 2), fill=inky.WHITE, outline=inky.RED)
+    draw.text((x, y), label, inky.RED, font=font)
+
+
 def parse_when(when):
     if not when:
         return "--:--"
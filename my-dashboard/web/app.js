@@ -1326,6 +1326,7 @@ const collectConfig = () => {
     version: currentConfig?.version ?? CONFIG_VERSION,
     active_preset: currentConfig?.active_preset ?? null,
     inky: currentConfig?.inky ?? null,
+    update_mode: currentConfig?.update_mode ?? null,
     update_interval_minutes: scheduleInput.value === "" ? null : Number(scheduleInput.value),
     fonts: {
       family: fontFamilySelect.value,